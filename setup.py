@@ -17,6 +17,10 @@ setup(
         'dev': [
             'pylint',
             'ipdb'
+        ],
+        'fast': [
+            'orjson',
+            'numpy'
         ]
     },
     entry_points="""
@@ -9,8 +9,12 @@ import sys
 import singer
 from tap_iterable.iterable import Iterable
 from tap_iterable.discover import discover_streams
+from tap_iterable.discovery_cache import DiscoveryCache, DEFAULT_DISCOVERY_CACHE_TTL
 from tap_iterable.sync import sync
 from tap_iterable.context import Context
+from tap_iterable.helper import to_bool
+from tap_iterable import telemetry
+import tap_iterable.writer as writer
 
 
 LOGGER = singer.get_logger()
@@ -21,14 +25,49 @@ REQUIRED_CONFIG_KEYS = [
     "start_date"
 ]
 
+# Optional config keys passed straight through to the `Iterable` client.
+OPTIONAL_CLIENT_CONFIG_KEYS = [
+    "api_window_in_days",
+    "pool_size",
+    "request_timeout",
+    "keep_alive",
+    "rate_limits",
+    "api_base_url"
+]
+
 
-def discover(client):
+def discover(client, config=None):
     LOGGER.info("Starting discover")
-    catalog = {"streams": discover_streams(client)}
+    config = config or {}
+    cache = None
+    catalog = None
+    if config.get("discovery_cache_dir"):
+        cache = DiscoveryCache(config["discovery_cache_dir"], config["api_key"],
+                               config.get("discovery_cache_ttl", DEFAULT_DISCOVERY_CACHE_TTL),
+                               api_base_url=config.get("api_base_url"))
+        if not to_bool(config.get("discovery_cache_refresh", False)):
+            catalog = cache.load()
+
+    if catalog is None:
+        client.check_api_credentials()
+        catalog = {"streams": discover_streams(client)}
+        if cache is not None:
+            cache.store(catalog)
     json.dump(catalog, sys.stdout, indent=2)
     LOGGER.info("Finished discover")
 
 
+def report_http_telemetry(config):
+    telemetry.emit_metrics()
+    path = config.get("prometheus_textfile")
+    if path:
+        try:
+            telemetry.write_prometheus_textfile(path)
+        except OSError as exc:
+            # Never fail (or hide the error of) a sync over its telemetry.
+            LOGGER.warning("Could not write Prometheus textfile {}: {}".format(path, exc))
+
+
 @singer.utils.handle_top_exception(LOGGER)
 def main():
     parsed_args = singer.utils.parse_args(REQUIRED_CONFIG_KEYS)
@@ -38,15 +77,23 @@ def main():
         "api_key": parsed_args.config['api_key']
     }
 
-    if "api_window_in_days" in parsed_args.config.keys():
-        creds["api_window_in_days"] = parsed_args.config['api_window_in_days']
+    for key in OPTIONAL_CLIENT_CONFIG_KEYS:
+        if key in parsed_args.config.keys():
+            creds[key] = parsed_args.config[key]
 
     client = Iterable(**creds)
     Context.config = parsed_args.config
-    client.check_api_credentials()
+    writer.configure(parsed_args.config.get("output_buffer_size_kb", writer.DEFAULT_BUFFER_SIZE_KB),
+                     to_bool(parsed_args.config.get("fast_json", True)))
 
-    if parsed_args.discover:
-        discover(client)
-    elif parsed_args.catalog:
-        state = parsed_args.state or {}
-        sync(client, parsed_args.catalog, state)
+    try:
+        if parsed_args.discover:
+            discover(client, parsed_args.config)
+        elif parsed_args.catalog:
+            client.check_api_credentials()
+            state = parsed_args.state or {}
+            sync(client, parsed_args.catalog, state)
+    finally:
+        writer.flush()
+        client.close()
+        report_http_telemetry(parsed_args.config)
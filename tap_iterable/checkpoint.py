@@ -0,0 +1,92 @@
+#
+# Module dependencies.
+#
+
+import time
+import singer
+
+
+LOGGER = singer.get_logger()
+
+
+class WindowCheckpointer():
+    """
+    Decides when a data export stream may checkpoint in the middle of a
+    window, every `every_records` records or `every_seconds` seconds
+    (0 disables either trigger).
+
+    A checkpoint moves the stream's bookmark to the replication value of the
+    last emitted record, so the next run resumes with a window narrowed to
+    start there. That is only sound while the export returns records in
+    replication key order, so checkpoints are suspended for the rest of a
+    window as soon as a record arrives out of order. A checkpoint already
+    written in that window may then be ahead of records not emitted yet, so
+    `rewind` is set: the bookmark must go back to `window_start`.
+
+    Only records with a replication value are observed; one without cannot
+    be placed in the order.
+
+    Disorder is only noticed once the late record arrives, so a checkpoint
+    written before that (and an interruption in between) still skips it.
+    `lag_seconds` narrows that risk: checkpoints stay that far behind the
+    last emitted record (but never before `window_start`), so records late
+    by less than the lag are fetched again on resume.
+    """
+
+    def __init__(self, every_records=0, every_seconds=0, lag_seconds=0):
+        self.every_records = int(every_records or 0)
+        self.every_seconds = float(every_seconds or 0)
+        self.lag = int(float(lag_seconds or 0) * 1000000)
+        self.enabled = self.every_records > 0 or self.every_seconds > 0
+        self.start_window(None)
+
+
+    def start_window(self, bookmark):
+        """ A new window starts, from the stream's `bookmark` (epoch microseconds). """
+        self.window_start = bookmark
+        self.watermark = None
+        self.in_order = True
+        self.rewind = False
+        self._checkpointed_in_window = False
+        self._records = 0
+        self._checkpointed_at = time.time()
+
+
+    def observe(self, value):
+        """ Track the replication value (epoch microseconds) of a record about to be emitted. """
+        if not self.enabled or not self.in_order or value is None:
+            return
+        if self.watermark is not None and value < self.watermark:
+            self.in_order = False
+            self.rewind = self._checkpointed_in_window
+            LOGGER.warning("Records of this export window are not in replication key order, "
+                           "skipping checkpoints until the window is complete")
+            return
+        self.watermark = value
+        self._records += 1
+
+
+    def due(self):
+        if not self.enabled or not self.in_order or self.watermark is None:
+            return False
+        if self.every_records and self._records >= self.every_records:
+            return True
+        return bool(self.every_seconds) and time.time() - self._checkpointed_at >= self.every_seconds
+
+
+    def checkpoint_value(self):
+        """ The bookmark (epoch microseconds) a checkpoint due now writes. """
+        value = self.watermark - self.lag
+        if self.window_start is not None:
+            value = max(value, self.window_start)
+        return value
+
+
+    def checkpointed(self):
+        self._records = 0
+        self._checkpointed_at = time.time()
+        self._checkpointed_in_window = True
+
+
+    def rewound(self):
+        self.rewind = False
@@ -0,0 +1,128 @@
+#
+# Module dependencies.
+#
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import queue
+import threading
+from tap_iterable import timing
+
+
+def ordered_map(func, items, max_workers=1):
+    """
+    Apply `func` to each of `items` on a pool of `max_workers` threads and
+    yield the results in the order of `items`.
+
+    `items` is consumed lazily: at most `max_workers` calls are in flight at
+    any time, and a new item is only pulled once the oldest result has been
+    handed to the caller. With `max_workers <= 1` everything runs inline on
+    the calling thread.
+    """
+    max_workers = int(max_workers or 1)
+    if max_workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    results = ordered_results(lambda item: timing.submit(executor, func, item), items, max_workers)
+    try:
+        for result in results:
+            yield result
+    finally:
+        results.close()
+        executor.shutdown(wait=True)
+
+
+def ordered_results(submit, items, max_in_flight):
+    """
+    Call `submit` (which returns a future, e.g. from an executor) for each of
+    `items` and yield the futures' results in the order of `items`, keeping
+    at most `max_in_flight` futures pending. Pending futures are cancelled
+    if the caller stops early.
+    """
+    iterator = iter(items)
+    pending = deque()
+    try:
+        for item in itertools.islice(iterator, max_in_flight):
+            pending.append(submit(item))
+        while pending:
+            result = pending.popleft().result()
+            for item in itertools.islice(iterator, 1):
+                pending.append(submit(item))
+            yield result
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+_DONE = object()
+
+
+def interleave(producers, max_workers=1, max_buffered_batches=16, batch_size=1000):
+    """
+    Run each of `producers` (callables returning an iterable) on a pool of
+    `max_workers` threads and yield their items as they arrive. Items from
+    one producer keep their order; items from different producers are
+    interleaved. Workers hand items over in batches through a queue bounded
+    to `max_buffered_batches`, so a slow consumer holds back the producers
+    instead of letting memory grow. With `max_workers <= 1` producers run
+    inline, one after another.
+    """
+    max_workers = int(max_workers or 1)
+    if max_workers <= 1:
+        for producer in producers:
+            for item in producer():
+                yield item
+        return
+
+    batches = queue.Queue(maxsize=max_buffered_batches)
+    stop = threading.Event()
+
+    def put(batch):
+        while not stop.is_set():
+            try:
+                batches.put(batch, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(producer):
+        if stop.is_set():
+            return
+        try:
+            batch = []
+            for item in producer():
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    if not put(batch):
+                        return
+                    batch = []
+            if batch:
+                put(batch)
+        except Exception as exc: # pylint: disable=broad-except
+            put(exc)
+        finally:
+            put(_DONE)
+
+    producers = list(producers)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        for producer in producers:
+            timing.submit(executor, run, producer)
+        remaining = len(producers)
+        while remaining:
+            batch = batches.get()
+            if batch is _DONE:
+                remaining -= 1
+            elif isinstance(batch, Exception):
+                raise batch
+            else:
+                for item in batch:
+                    yield item
+    finally:
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -3,12 +3,16 @@
 #
 
 import singer
+from tap_iterable.concurrency import ordered_map
+from tap_iterable.context import Context
 from tap_iterable.streams import STREAMS
 from tap_iterable.exceptions import IterableForbiddenError
 
 
 LOGGER = singer.get_logger()
 
+DEFAULT_DISCOVERY_CONCURRENCY = 8
+
 
 def _apply_access_checks(client, accessible_streams: list) -> None:
     """
@@ -18,12 +22,23 @@ def _apply_access_checks(client, accessible_streams: list) -> None:
     effectively identifies only inaccessible parent streams by design.
     Child stream removal is handled separately by _prune_inaccessible_children().
     Raises IterableForbiddenError if no parent streams are accessible.
+    Up to `discovery_concurrency` probes run at the same time on the client's
+    shared connection pool.
     """
-    inaccessible_streams = [
-        stream_name
+    candidates = [
+        (stream_name, stream_cls)
         for stream_name, stream_cls in STREAMS.items()
         if stream_name in accessible_streams
-        and not stream_cls(client=client).check_access()
+    ]
+    access = ordered_map(
+        lambda candidate: candidate[1](client=client).check_access(),
+        candidates,
+        int(Context.config.get("discovery_concurrency", DEFAULT_DISCOVERY_CONCURRENCY)),
+    )
+    inaccessible_streams = [
+        stream_name
+        for (stream_name, _), has_access in zip(candidates, access)
+        if not has_access
     ]
 
     for stream_name in inaccessible_streams:
@@ -0,0 +1,81 @@
+#
+# Module dependencies.
+#
+
+import hashlib
+from importlib.metadata import version as package_version, PackageNotFoundError
+import json
+import os
+import tempfile
+import time
+import singer
+from tap_iterable.iterable import DEFAULT_API_BASE_URL
+
+
+LOGGER = singer.get_logger()
+
+DEFAULT_DISCOVERY_CACHE_TTL = 3600
+
+
+def tap_version():
+    try:
+        return package_version("tap-iterable")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+class DiscoveryCache():
+    """
+    Stores the catalog generated by discovery (which only lists the streams
+    the credentials can read) in `cache_dir` for `ttl` seconds. Entries are
+    keyed by a hash of the API key, the API base URL and the tap version, so
+    the key itself is never written to disk, each data center has its own
+    entry and upgrading the tap invalidates old catalogs.
+    """
+
+    def __init__(self, cache_dir, api_key, ttl=DEFAULT_DISCOVERY_CACHE_TTL, version=None, api_base_url=None):
+        self.cache_dir = cache_dir
+        self.ttl = float(ttl)
+        self.version = version or tap_version()
+        # Normalized as the client does, so equivalent URLs share an entry.
+        api_base_url = (api_base_url or DEFAULT_API_BASE_URL).rstrip("/") + "/"
+        key = hashlib.sha256("{}\n{}\n{}".format(api_key, api_base_url, self.version).encode("utf-8")).hexdigest()
+        self.path = os.path.join(cache_dir, "discovery-{}.json".format(key))
+
+
+    def load(self):
+        """ The cached catalog, or None if there is no fresh entry. """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as exc:
+            LOGGER.warning("Ignoring unreadable discovery cache {}: {}".format(self.path, exc))
+            return None
+
+        age = time.time() - entry.get("created_at", 0)
+        if entry.get("version") != self.version or not 0 <= age < self.ttl:
+            return None
+        LOGGER.info("Using discovery cached {} seconds ago ({} accessible streams)".format(
+            int(age), len(entry["catalog"]["streams"])))
+        return entry["catalog"]
+
+
+    def store(self, catalog):
+        entry = {
+            "created_at": time.time(),
+            "version": self.version,
+            "catalog": catalog,
+        }
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write to a temp file and rename it, so concurrent discoveries never
+        # read a partially written entry.
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
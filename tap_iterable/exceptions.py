@@ -1,11 +1,14 @@
 import requests
+from tap_iterable.rate_limit import parse_retry_after
 
 
 class IterableError(Exception):
-    def __init__(self, message=None, response=None):
+    def __init__(self, message=None, response=None, retry_after=None):
         super().__init__(message)
         self.message = message
         self.response = response
+        # Seconds the server asked us to wait before retrying, if any.
+        self.retry_after = retry_after
 
 
 class IterableBadRequestError(IterableError):
@@ -78,4 +81,8 @@ def raise_for_error(response):
         if error_code > 500 and error_code not in ERROR_CODE_EXCEPTION_MAPPING.keys():
             exc = IterableServer5xxError
 
-        raise exc(message) from None
+        retry_after = None
+        if error_code in (429, 503):
+            retry_after = parse_retry_after((getattr(response, "headers", None) or {}).get("Retry-After"))
+
+        raise exc(message, response=response, retry_after=retry_after) from None
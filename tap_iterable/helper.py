@@ -1,7 +1,18 @@
 import datetime
+import functools
+import json
 from typing import Dict
 
 import pytz
+from singer import utils
+from tap_iterable import datetimes
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=pytz.UTC)
 
 CASE_SENSITIVE_FIELD_MAP = {
     # Conflicting field --> Field with `_` as a prefix
@@ -12,6 +23,8 @@ CASE_SENSITIVE_FIELD_MAP = {
 
 def epoch_to_datetime_string(milliseconds):
     """Function to convert epoch time to datetime """
+    if datetimes.is_exact_millis(milliseconds):
+        return datetimes.format_millis_naive(milliseconds)
     datetime_string = None
     try:
         datetime_string = datetime.datetime.fromtimestamp(milliseconds / 1000.0, pytz.timezone("UTC")).strftime(
@@ -22,6 +35,56 @@ def epoch_to_datetime_string(milliseconds):
     return datetime_string
 
 
+def loads(data):
+    """
+    Parses a JSON document from bytes or a memoryview without decoding it to
+    `str` first. Uses orjson when installed; documents it rejects (e.g. NaN or
+    integers beyond 64 bits) take the stdlib path.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data) # pylint: disable=no-member
+        except orjson.JSONDecodeError: # pylint: disable=no-member
+            pass
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+def to_epoch_micros(value):
+    """
+    Function to convert a replication key or bookmark value to integer epoch
+    microseconds. Iterable sends epoch milliseconds, while bookmarks already
+    in state (and some API fields) are datetime strings.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return _datetime_string_to_epoch_micros(value)
+    return int(round(value * 1000))
+
+
+@functools.lru_cache(maxsize=4096)
+def _datetime_string_to_epoch_micros(value):
+    micros = datetimes.export_datetime_to_epoch_micros(value)
+    if micros is not None:
+        return micros
+    delta = utils.strptime_to_utc(value) - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def epoch_micros_to_datetime(value):
+    """Function to convert integer epoch microseconds to a UTC datetime."""
+    return EPOCH + datetime.timedelta(microseconds=value)
+
+
+def to_bool(value):
+    """Function to interpret boolean config values, which may arrive as strings."""
+    if isinstance(value, str):
+        return value.strip().lower() not in ("false", "0", "no", "off", "")
+    return bool(value)
+
+
 def transform_case_sensitive_fields(record):
     """Function to transform case-sensitive fields to be prefixed with `_`."""
 
@@ -4,27 +4,94 @@
 #
 
 from datetime import datetime, timedelta
-from singer.utils import strptime_with_tz, strftime
+from singer.utils import strptime_with_tz
 from urllib.parse import urlencode
+import functools
+import threading
+import time
 import backoff
 import requests
+import singer.metrics as metrics
+from requests.adapters import HTTPAdapter
 import logging
 import tap_iterable.helper as helper
+from tap_iterable.context import Context
 from tap_iterable.exceptions import IterableRateLimitError, IterableNotAvailableError, IterableServer5xxError, \
   raise_for_error
+from tap_iterable.rate_limit import RateLimiter, retry_after_expo
+from tap_iterable.concurrency import interleave, ordered_map
+from tap_iterable import telemetry, timing
 
 LOGGER = logging.getLogger()
 
+DEFAULT_API_BASE_URL = "https://api.iterable.com/api/"
+DEFAULT_POOL_SIZE = 10
+# (connect, read) timeouts in seconds. The read timeout applies between bytes,
+# so long-running export downloads are not cut off as long as data keeps flowing.
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_REQUEST_TIMEOUT = 300
+DEFAULT_LIST_USERS_CONCURRENCY = 1
+DEFAULT_METADATA_CONCURRENCY = 1
+DEFAULT_TEMPLATES_CONCURRENCY = 4
+LIST_USERS_CHUNK_SIZE = 64 * 1024
+
+
+def _log_retry(details):
+  """ `backoff` handler counting the retries of `_get` per endpoint. """
+  telemetry.record_backoff(telemetry.endpoint_name(details["args"][1]), details["wait"])
+
+
+def _log_metadata_retry(details):
+  """ `backoff` handler counting the retries of `_metadata_value` under its key's endpoint. """
+  key = details["args"][1]
+  path = "metadata/{table_name}/{key}".format(table_name=key["table"], key=key["key"])
+  telemetry.record_backoff(telemetry.endpoint_name(path), details["wait"])
+
 
 class Iterable(object):
   """ Simple wrapper for Iterable. """
 
-  def __init__(self, api_key, start_date=None, api_window_in_days=30):
+  def __init__(self, api_key, start_date=None, api_window_in_days=30, pool_size=DEFAULT_POOL_SIZE,
+               request_timeout=DEFAULT_REQUEST_TIMEOUT, keep_alive=True, rate_limits=None, api_base_url=None):
     self.api_key = api_key
-    self.uri = "https://api.iterable.com/api/"
+    # Overridable for Iterable's EU data center or a local test server.
+    self.uri = (api_base_url or DEFAULT_API_BASE_URL).rstrip("/") + "/"
     self.api_window_in_days = float(api_window_in_days)
     self.MAX_BYTES = 10240
     self.CHUNK_SIZE = 512
+    self.pool_size = int(pool_size)
+    self.timeout = (DEFAULT_CONNECT_TIMEOUT, float(request_timeout))
+    self.keep_alive = helper.to_bool(keep_alive)
+    # A single adapter (and therefore a single urllib3 connection pool) is shared
+    # by every thread; each thread gets its own `Session` on top of it because
+    # `Session` itself is not guaranteed to be thread-safe.
+    self._adapter = HTTPAdapter(pool_connections=self.pool_size,
+                                pool_maxsize=self.pool_size,
+                                pool_block=True)
+    self._local = threading.local()
+    # Requests per minute per endpoint family, e.g. {"export": 4, "lists/getUsers": 5}.
+    self.rate_limiter = RateLimiter(rate_limits)
+
+
+  @property
+  def session(self):
+    """ Thread-local session backed by the shared connection pool. """
+    session = getattr(self._local, "session", None)
+    if session is None:
+      session = requests.Session()
+      session.mount("https://", self._adapter)
+      session.mount("http://", self._adapter)
+      session.headers.update({
+        "api_key": self.api_key,
+        "Connection": "keep-alive" if self.keep_alive else "close"
+      })
+      self._local.session = session
+    return session
+
+
+  def close(self):
+    """ Release pooled connections. """
+    self._adapter.close()
 
 
   def _now(self):
@@ -43,36 +110,58 @@ class Iterable(object):
     else:
       yield strptime_with_tz(start_date).strftime("%Y-%m-%d %H:%M:%S")
 
-  @backoff.on_exception(backoff.expo,
+  @backoff.on_exception(retry_after_expo,
                         (IterableRateLimitError, IterableNotAvailableError, IterableServer5xxError),
                         max_tries=7,
                         jitter=None,
                         base=2,
-                        factor=2)
+                        factor=2,
+                        on_backoff=_log_retry)
   def _get(self, path, stream=True, **kwargs):
     """ The actual `get` request.  """
     uri = "{uri}{path}".format(uri=self.uri, path=path)
 
-    # Add query params, including `api_key`.
+    # Query params; `api_key` is sent as a session header.
     params = {}
-    headers = {"api_key": self.api_key}
     for key, value in kwargs.items():
       params[key] = value
-    uri += "?{params}".format(params=urlencode(params))
-    LOGGER.info("GET request to {uri}".format(uri=uri))
-
-    response = requests.get(uri, stream=stream, headers=headers, params=params)
-    LOGGER.info("Response status:%s", response.status_code)
-
-    raise_for_error(response)
-
+    LOGGER.info("GET request to {uri}?{params}".format(uri=uri, params=urlencode(params, doseq=True)))
+
+    endpoint = telemetry.endpoint_name(path)
+    telemetry.record_rate_limit_wait(endpoint, self.rate_limiter.acquire(path))
+    with metrics.http_request_timer(endpoint) as timer:
+      started = time.perf_counter()
+      response = self.session.get(uri, stream=stream, params=params, timeout=self.timeout)
+      elapsed = time.perf_counter() - started
+      timing.add("http_wait", elapsed)
+      telemetry.record_response(endpoint, response.status_code, elapsed)
+      timer.tags[metrics.Tag.http_status_code] = response.status_code
+      LOGGER.info("Response status:%s", response.status_code)
+
+      try:
+        raise_for_error(response)
+      except IterableRateLimitError as exc:
+        # Hold back the whole endpoint family, not just this call.
+        self.rate_limiter.throttled(path, exc.retry_after)
+        raise
+
+    # For consumers of streamed bodies, which report their transfer time.
+    response.telemetry_endpoint = endpoint
     return response
 
 
   def get(self, path, **kwargs):
     """" The common `get` request. """
     response = self._get(path, **kwargs)
-    return response.json()
+    started = time.perf_counter()
+    content = response.content
+    parse_started = time.perf_counter()
+    size = len(content or b"")
+    timing.add("download", parse_started - started, size)
+    telemetry.record_transfer(telemetry.endpoint_name(path), parse_started - started, size)
+    data = response.json()
+    timing.add("parse", time.perf_counter() - parse_started)
+    return data
 
 
   def get_user_fields(self):
@@ -99,26 +188,44 @@ class Iterable(object):
 
   def list_users(self, column_name=None, bookmark=None):
     res = self.get("lists")
-    for l in res["lists"]:
-      kwargs = {
-        "listId": l["id"]
-      }
-      users = [x for x in self._get(
-          "lists/getUsers", **kwargs).content.decode().split('\n') if x.strip()]
-      for user in users:
-        yield {
-          "email": user,
-          "listId": l["id"],
-          "updatedAt": datetime.now().strftime("%Y-%m-%d %H:%M:%S %Z")
-        }
+    producers = [functools.partial(self._list_users_of, l["id"]) for l in res["lists"]]
+    # Lists are fetched on a bounded pool and members are streamed line by
+    # line, so memory does not depend on the size of a list.
+    concurrency = int(Context.config.get("list_users_concurrency", DEFAULT_LIST_USERS_CONCURRENCY))
+    return interleave(producers, max_workers=concurrency)
+
+
+  def _list_users_of(self, list_id):
+    updated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S %Z")
+    response = self._get("lists/getUsers", listId=list_id)
+    read_seconds = 0.0
+    size = 0
+    try:
+      read_started = time.perf_counter()
+      for line in response.iter_lines(chunk_size=LIST_USERS_CHUNK_SIZE):
+        read_seconds += time.perf_counter() - read_started
+        size += len(line) + 1
+        if line.strip():
+          yield {
+            "email": line.decode(),
+            "listId": list_id,
+            "updatedAt": updated_at
+          }
+        read_started = time.perf_counter()
+      read_seconds += time.perf_counter() - read_started
+    finally:
+      response.close()
+      timing.add("download", read_seconds, size)
+      telemetry.record_transfer(response.telemetry_endpoint, read_seconds, size)
 
 
   def campaigns(self, column_name=None, bookmark=None):
-    bookmark = strptime_with_tz(bookmark)
+    # Compared as epoch microseconds, like templates, rather than formatting
+    # and parsing back every campaign's timestamp.
+    bookmark_val = helper.to_epoch_micros(bookmark)
     res = self.get("campaigns")
     for c in res["campaigns"]:
-      rec_date_time = strptime_with_tz(helper.epoch_to_datetime_string(c[column_name]))
-      if rec_date_time >= bookmark:
+      if helper.to_epoch_micros(c[column_name]) >= bookmark_val:
         yield c
 
 
@@ -163,30 +270,73 @@ class Iterable(object):
 
     ########################################################################################
 
-    bookmark_val = strptime_with_tz(bookmark)
-    bookmark = strftime(bookmark_val)
-    for template_type in template_types:
-      for medium in message_mediums:
-        res = self.get("templates", templateType=template_type, messageMedium=medium)
-        for t in res["templates"]:
-          rec_date_time = strptime_with_tz(helper.epoch_to_datetime_string(t[column_name]))
-          if rec_date_time >= bookmark_val:
-            yield t
+    bookmark_val = helper.to_epoch_micros(bookmark)
+
+    def get_templates(combination):
+      template_type, medium = combination
+      res = self.get("templates", templateType=template_type, messageMedium=medium)
+      return [t for t in res["templates"] if helper.to_epoch_micros(t[column_name]) >= bookmark_val]
+
+    # The type/medium combinations are requested concurrently and filtered as
+    # each arrives; a template returned by several combinations is emitted once.
+    combinations = [(template_type, medium) for template_type in template_types for medium in message_mediums]
+    seen_template_ids = set()
+    concurrency = int(Context.config.get("templates_concurrency", DEFAULT_TEMPLATES_CONCURRENCY))
+    for templates in ordered_map(get_templates, combinations, concurrency):
+      for t in templates:
+        if t["templateId"] in seen_template_ids:
+          continue
+        seen_template_ids.add(t["templateId"])
+        yield t
 
 
   def metadata(self, column_name=None, bookmark=None):
+    concurrency = int(Context.config.get("metadata_concurrency", DEFAULT_METADATA_CONCURRENCY))
     tables = self.get("metadata")
     for t in tables["results"]:
       keys = self.get("metadata/{table_name}".format(table_name=t["name"]))
-      for k in keys["results"]:
-        value = self.get("metadata/{table_name}/{key}".format(table_name=k["table"], key=k["key"]))
+      # Key values are fetched on a bounded pool (sharing the rate limiter)
+      # but yielded in key order, so the output stays deterministic.
+      for value in ordered_map(self._metadata_value, keys["results"], concurrency):
         yield value
 
 
-  def get_start_end_date(self, bookmark):
+  @backoff.on_exception(backoff.expo,
+                        (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                         requests.exceptions.ChunkedEncodingError),
+                        max_tries=3,
+                        jitter=None,
+                        factor=2,
+                        on_backoff=_log_metadata_retry)
+  def _metadata_value(self, k):
+    """ A single key lookup, retried on its own if the connection fails. """
+    return self.get("metadata/{table_name}/{key}".format(table_name=k["table"], key=k["key"]))
+
+
+  def _planned_daterange(self, start_date, end_date, planner):
+    """ Like `_daterange`, but window sizes are chosen by `planner` as windows are scheduled. """
+    start = strptime_with_tz(start_date)
+    end = strptime_with_tz(end_date)
+    while True:
+      remaining_days = (end - start).total_seconds() / 86400.0
+      window_in_days = planner.plan(max(remaining_days, 0))
+      window_end = start + timedelta(window_in_days)
+      yield start.strftime("%Y-%m-%d %H:%M:%S"), window_end.strftime("%Y-%m-%d %H:%M:%S")
+      if window_end >= end:
+        break
+      start = window_end
+
+
+  def get_start_end_date(self, bookmark, planner=None):
     now = self._now()
-    kwargs = {}
+    if planner is not None:
+      for start_date_time, end_date_time in self._planned_daterange(bookmark, now, planner):
+        yield {"startDateTime": start_date_time, "endDateTime": end_date_time}
+      return
+
     for start_date_time in self._daterange(bookmark, now):
+      # A fresh dict per window, as windows may be fetched concurrently.
+      kwargs = {}
       kwargs["startDateTime"] = start_date_time
       endDateTime = (strptime_with_tz(start_date_time) + timedelta(
         self.api_window_in_days)).strftime("%Y-%m-%d %H:%M:%S")
@@ -197,8 +347,11 @@ class Iterable(object):
       yield kwargs
 
 
-  def get_data_export_generator(self, data_type_name, bookmark=None):
-    for kwargs in self.get_start_end_date(bookmark):
-      def get_data():
-        return self._get("export/data.json", dataTypeName=data_type_name, **kwargs), kwargs['endDateTime']
+  def get_data_export_generator(self, data_type_name, bookmark=None, planner=None, only_fields=None):
+    # `only_fields` restricts the export to those fields (sent as repeated
+    # `onlyFields` parameters), so unselected fields are never downloaded.
+    for kwargs in self.get_start_end_date(bookmark, planner):
+      def get_data(kwargs=kwargs):
+        params = dict(kwargs, onlyFields=list(only_fields)) if only_fields else kwargs
+        return self._get("export/data.json", dataTypeName=data_type_name, **params), kwargs['endDateTime']
       yield get_data
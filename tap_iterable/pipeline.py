@@ -0,0 +1,411 @@
+#
+# Module dependencies.
+#
+
+from collections import deque
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import mmap
+import struct
+import tempfile
+import threading
+import time
+import zlib
+import singer
+from tap_iterable import telemetry, timing
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+LOGGER = singer.get_logger()
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DEFAULT_BUFFER_SIZE_MB = 64
+
+
+# Compressed spill files are a sequence of frames, each prefixed by its length.
+FRAME_HEADER = struct.Struct(">I")
+
+# A region of an uncompressed spill file, read through a memory map.
+MappedRegion = namedtuple("MappedRegion", ["mmap", "start", "end"])
+
+
+class DownloadCancelled(Exception):
+    pass
+
+
+class SpillCodec():
+    """ Compression applied to each chunk written to a spill file. """
+
+    def __init__(self, name, compress, decompress):
+        self.name = name
+        self.compress = compress
+        self.decompress = decompress
+
+
+def get_spill_codec(name):
+    """
+    Returns the `SpillCodec` for a `spill_compression` setting, or None for
+    uncompressed spill files. `gzip` uses the fastest zlib level; `lz4` and
+    `zstd` need the `lz4` and `zstandard` packages.
+    """
+    name = (name or "none").lower()
+    if name == "none":
+        return None
+    if name in ("gzip", "zlib"):
+        return SpillCodec(name, lambda data: zlib.compress(data, 1), zlib.decompress)
+    if name == "lz4":
+        if lz4_frame is None:
+            raise ValueError("spill_compression 'lz4' requires the 'lz4' package")
+        return SpillCodec(name, lz4_frame.compress, lz4_frame.decompress)
+    if name == "zstd":
+        if zstandard is None:
+            raise ValueError("spill_compression 'zstd' requires the 'zstandard' package")
+        compressor = zstandard.ZstdCompressor(level=1)
+        decompressor = zstandard.ZstdDecompressor()
+        # Compression contexts are not thread-safe; each buffer has a single
+        # producer and a single consumer thread, but buffers run in parallel.
+        lock = threading.Lock()
+
+        def compress(data):
+            with lock:
+                return compressor.compress(data)
+
+        def decompress(data):
+            with lock:
+                return decompressor.decompress(data)
+
+        return SpillCodec(name, compress, decompress)
+    raise ValueError("Unknown spill_compression '{}', expected one of none, gzip, lz4, zstd".format(name))
+
+
+class SpillBuffer():
+    """
+    Bounded FIFO of byte chunks handed from a download thread to the emitting
+    thread. Chunks are kept in memory while the consumer keeps up; once
+    `max_memory_bytes` is reached (i.e. the target applies backpressure) new
+    chunks are appended to a temp file in `spill_dir` instead, compressed
+    with `codec` if one is given. The spill file is read back before the
+    buffer returns to memory, so chunk order is always preserved.
+
+    Uncompressed spill files are not read back into new byte strings: `get()`
+    returns a `MappedRegion` covering everything spilled so far, which the
+    consumer parses in place through a memory map.
+    """
+
+    def __init__(self, max_memory_bytes, spill_dir=None, codec=None):
+        self.max_memory_bytes = max_memory_bytes
+        self.spill_dir = spill_dir
+        self.codec = codec
+        self.bytes_spilled = 0
+        self.bytes_spilled_on_disk = 0
+        self._cond = threading.Condition()
+        self._chunks = deque()
+        self._memory_bytes = 0
+        self._spill = None
+        self._spill_map = None
+        self._spill_write_pos = 0
+        self._spill_read_pos = 0
+        self._finished = False
+        self._cancelled = False
+        self._error = None
+
+
+    def put(self, chunk):
+        with self._cond:
+            if self._cancelled:
+                raise DownloadCancelled()
+            if self._spill is None and (not self._chunks or
+                                        self._memory_bytes + len(chunk) <= self.max_memory_bytes):
+                self._chunks.append(chunk)
+                self._memory_bytes += len(chunk)
+            else:
+                started = time.perf_counter()
+                if self._spill is None:
+                    self._spill = tempfile.TemporaryFile(dir=self.spill_dir)
+                data = chunk
+                if self.codec is not None:
+                    data = self.codec.compress(chunk)
+                    data = FRAME_HEADER.pack(len(data)) + data
+                self._spill.seek(self._spill_write_pos)
+                self._spill.write(data)
+                self._spill_write_pos += len(data)
+                self.bytes_spilled += len(chunk)
+                self.bytes_spilled_on_disk += len(data)
+                timing.add("spill_write", time.perf_counter() - started, len(data))
+            self._cond.notify()
+
+
+    def finish(self, error=None):
+        """ Called by the producer once the download is complete or failed. """
+        with self._cond:
+            self._finished = True
+            self._error = error
+            self._cond.notify()
+
+
+    def get(self):
+        """
+        Next chunk in order as bytes or a `MappedRegion`, or None once the
+        producer has finished.
+        """
+        with self._cond:
+            while True:
+                if self._chunks:
+                    chunk = self._chunks.popleft()
+                    self._memory_bytes -= len(chunk)
+                    return chunk
+                if self._spill is not None:
+                    chunk = self._read_spill()
+                    break
+                if self._error is not None:
+                    raise self._error
+                if self._finished:
+                    return None
+                self._cond.wait()
+        # Decompress outside the lock so the producer is not held up.
+        if self.codec is not None and not isinstance(chunk, MappedRegion):
+            chunk = self.codec.decompress(chunk)
+        return chunk
+
+
+    def _read_spill(self):
+        self._spill.seek(self._spill_read_pos)
+        if self.codec is not None:
+            size, = FRAME_HEADER.unpack(self._spill.read(FRAME_HEADER.size))
+            chunk = self._spill.read(size)
+            self._spill_read_pos += FRAME_HEADER.size + size
+        else:
+            chunk = self._map_spill()
+            self._spill_read_pos = chunk.end
+        if self._spill_read_pos >= self._spill_write_pos:
+            # Spill fully drained, switch the producer back to memory.
+            self._close_spill()
+        return chunk
+
+
+    def _map_spill(self):
+        """ Everything spilled and not read yet, as a region of the mapped spill file. """
+        if self._spill_map is None or len(self._spill_map) < self._spill_write_pos:
+            # The file has grown since it was mapped (or was never mapped).
+            self._spill.flush()
+            self._spill_map = mmap.mmap(self._spill.fileno(), 0, access=mmap.ACCESS_READ)
+        return MappedRegion(self._spill_map, self._spill_read_pos, self._spill_write_pos)
+
+
+    def close(self):
+        """ Cancel the producer and release the spill file. """
+        with self._cond:
+            self._cancelled = True
+            self._chunks.clear()
+            self._memory_bytes = 0
+            self._close_spill()
+            self._cond.notify_all()
+
+
+    def _close_spill(self):
+        if self._spill is not None:
+            # A region handed to the consumer keeps its map (and so the
+            # unlinked file's data) alive until the consumer is done with it.
+            self._spill_map = None
+            self._spill.close()
+            self._spill = None
+            self._spill_write_pos = 0
+            self._spill_read_pos = 0
+
+
+class ExportWindow():
+    """
+    A single data export window whose response body is downloaded on a
+    background thread while the caller consumes `iter_lines()`.
+    """
+
+    def __init__(self, fn, max_memory_bytes, spill_dir=None, spill_codec=None):
+        self.fn = fn
+        self.buffer = SpillBuffer(max_memory_bytes, spill_dir, spill_codec)
+        self.request_end_date = None
+        self.bytes_received = 0
+        self.bytes_transferred = None
+        self.download_seconds = None
+        self._ready = threading.Event()
+
+
+    def download(self):
+        """ Producer side; runs on a worker thread. """
+        start_time = time.time()
+        response = None
+        error = None
+        cancelled = False
+        read_seconds = 0.0
+        try:
+            response, self.request_end_date = self.fn()
+            self._ready.set()
+            read_started = time.perf_counter()
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                read_seconds += time.perf_counter() - read_started
+                if chunk:
+                    self.bytes_received += len(chunk)
+                    self.buffer.put(chunk)
+                read_started = time.perf_counter()
+            read_seconds += time.perf_counter() - read_started
+        except DownloadCancelled:
+            cancelled = True
+        except Exception as exc: # pylint: disable=broad-except
+            error = exc
+        finally:
+            if response is not None:
+                self.bytes_transferred = self._bytes_on_the_wire(response)
+                response.close()
+            self.download_seconds = time.time() - start_time
+            timing.add("download", read_seconds, self.bytes_received)
+            if response is not None:
+                telemetry.record_transfer(getattr(response, "telemetry_endpoint", "export/data.json"),
+                                          read_seconds, self.bytes_received)
+            self.buffer.finish(error)
+            self._ready.set()
+        if error is None and not cancelled:
+            LOGGER.info('downloaded {} bytes ({} transferred) in {} seconds ({} bytes spilled to disk as {} bytes)'.format(
+                self.bytes_received, self.bytes_transferred, int(self.download_seconds),
+                self.buffer.bytes_spilled, self.buffer.bytes_spilled_on_disk))
+
+
+    def _bytes_on_the_wire(self, response):
+        """ Bytes read from the connection, i.e. before gzip decoding, when known. """
+        try:
+            transferred = response.raw.tell()
+        except Exception: # pylint: disable=broad-except
+            return None
+        # urllib3 does not count the bytes of chunked responses.
+        if not transferred and self.bytes_received:
+            return None
+        return transferred
+
+
+    def iter_lines(self):
+        """
+        Consumer side; yields the non-empty lines of the response body in
+        order, without their line feed. Lines are zero-copy memoryviews into
+        the downloaded chunks or the mapped spill file, except for the few
+        that straddle two chunks; they are only valid until the next line is
+        requested.
+        """
+        pending = b""
+        while True:
+            chunk = self.buffer.get()
+            if chunk is None:
+                break
+            if isinstance(chunk, MappedRegion):
+                data, pos, end = chunk.mmap, chunk.start, chunk.end
+            else:
+                data, pos, end = chunk, 0, len(chunk)
+            view = memoryview(data)
+            while pos < end:
+                newline = data.find(b"\n", pos, end)
+                if newline < 0:
+                    pending += view[pos:end]
+                    break
+                if pending:
+                    line = pending + view[pos:newline]
+                    pending = b""
+                else:
+                    line = view[pos:newline]
+                pos = newline + 1
+                if line and line != b"\r":
+                    yield line
+        # Sometimes the last line does not end with a line feed.
+        if pending and pending != b"\r":
+            yield pending
+
+
+    def iter_batches(self, batch_size):
+        """
+        Consumer side, for handing the body to other processes: yields it in
+        `bytes` blobs of about `batch_size` bytes (more only for lines longer
+        than that) that always end on a line boundary (except possibly the
+        last one). `batch_lines` splits a blob
+        into the lines `iter_lines` would have yielded.
+        """
+        buffered = bytearray()
+        while True:
+            chunk = self.buffer.get()
+            if chunk is None:
+                break
+            if isinstance(chunk, MappedRegion):
+                data, pos, end = chunk.mmap, chunk.start, chunk.end
+            else:
+                data, pos, end = chunk, 0, len(chunk)
+            # A region of the spill file can hold most of the window, so it is
+            # copied a batch at a time rather than whole.
+            while pos < end:
+                step = min(end, pos + batch_size)
+                buffered += data[pos:step]
+                pos = step
+                while len(buffered) >= batch_size:
+                    cut = buffered.rfind(b"\n") + 1
+                    if not cut:
+                        # A line longer than a batch; wait for its end.
+                        break
+                    yield bytes(buffered[:cut])
+                    del buffered[:cut]
+        if buffered:
+            yield bytes(buffered)
+
+
+    def wait_until_started(self):
+        """ Block until the request has been answered, so `request_end_date` is known. """
+        self._ready.wait()
+
+
+    def close(self):
+        self.buffer.close()
+
+
+def batch_lines(data):
+    """ The non-empty lines of a blob from `ExportWindow.iter_batches`. """
+    for line in data.split(b"\n"):
+        if line and line != b"\r":
+            yield line
+
+
+def pipelined_export_windows(fns, concurrency=1, max_memory_bytes=DEFAULT_BUFFER_SIZE_MB * 1024 * 1024,
+                             spill_dir=None, spill_codec=None):
+    """
+    Start downloading export windows from the `fns` closures and yield them
+    as `ExportWindow`s in order. At most `concurrency` windows are started
+    ahead of the one being consumed (including it), so with the default of 1
+    the next window is only requested once the current one has been emitted.
+    """
+    concurrency = max(int(concurrency or 1), 1)
+    iterator = iter(fns)
+    pending = deque()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def start_next():
+        for fn in iterator:
+            window = ExportWindow(fn, max_memory_bytes, spill_dir, spill_codec)
+            pending.append((window, timing.submit(executor, window.download)))
+            return True
+        return False
+
+    try:
+        while len(pending) < concurrency and start_next():
+            pass
+        while pending:
+            window, future = pending[0]
+            window.wait_until_started()
+            yield window
+            pending.popleft()
+            future.result()
+            start_next()
+    finally:
+        for window, _ in pending:
+            window.close()
+        executor.shutdown(wait=True)
@@ -0,0 +1,94 @@
+#
+# Module dependencies.
+#
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import traceback
+from tap_iterable.concurrency import ordered_results
+
+
+# The function each worker process applies to the items it is handed,
+# built once per process by `_start_worker`.
+_WORKER = None
+
+
+class WorkerError(Exception):
+    """ An exception raised on a worker process, with its traceback as the message. """
+
+
+def _start_worker(factory, args):
+    global _WORKER # pylint: disable=global-statement
+    _WORKER = factory(*args)
+
+
+def _run_worker(item):
+    try:
+        return _WORKER(item)
+    except Exception: # pylint: disable=broad-except
+        # Not every exception survives pickling (e.g. singer's SchemaMismatch
+        # needs its original arguments), so send back the formatted traceback.
+        raise WorkerError(traceback.format_exc()) from None
+
+
+class ProcessPool():
+    """
+    A pool of `processes` worker processes, each of which calls
+    `factory(*args)` once at start-up to build a picklable-in, picklable-out
+    function. `map` applies it to items on the workers and yields the
+    results in order.
+
+    Workers are spawned rather than forked, as the tap has download threads
+    (and their locks) running when a pool is started.
+    """
+
+    def __init__(self, processes, factory, args=()):
+        self.processes = int(processes)
+        self._executor = ProcessPoolExecutor(max_workers=self.processes,
+                                             mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_start_worker,
+                                             initargs=(factory, args))
+
+
+    def map(self, items):
+        """
+        Results for `items` in order. Two items per process are kept in
+        flight, so a worker never waits for the caller to hand it more.
+        """
+        return ordered_results(lambda item: self._executor.submit(_run_worker, item),
+                               items, 2 * self.processes)
+
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class InlinePool():
+    """ A `ProcessPool` stand-in that builds the function on, and runs it on, the calling thread. """
+
+    def __init__(self, factory, args=()):
+        self._worker = factory(*args)
+
+
+    def map(self, items):
+        return (self._worker(item) for item in items)
+
+
+    def close(self):
+        pass
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
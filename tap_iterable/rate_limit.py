@@ -0,0 +1,129 @@
+#
+# Module dependencies.
+#
+
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import threading
+import time
+import backoff
+import singer
+
+
+LOGGER = singer.get_logger()
+
+
+class TokenBucket():
+    """
+    Thread-safe token bucket allowing `rate` requests per second on average,
+    with bursts of up to `capacity` requests. A bucket without a rate never
+    runs dry, but can still be paused.
+    """
+
+    def __init__(self, rate=None, capacity=None):
+        self.rate = float(rate) if rate else None
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate or 1.0)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+
+    def acquire(self):
+        """ Take one token, sleeping until it is available. Returns the seconds waited. """
+        with self._lock:
+            now = time.monotonic()
+            wait = max(self._paused_until - now, 0.0)
+            if self.rate:
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                # Reserve the token now, going into debt if needed, so waiting
+                # callers are served in the order they arrived.
+                self._tokens -= 1
+                wait = max(wait, -self._tokens / self.rate)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+    def pause(self, seconds):
+        """ Hold back every request for `seconds`, e.g. after the server throttled us. """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class RateLimiter():
+    """
+    Paces requests per endpoint family, e.g. `export` for `export/data.json`
+    or `lists/getUsers`. `rates` maps a family to its allowed requests per
+    minute; a request belongs to the longest configured family its path
+    starts with, falling back to the first path segment. Families without a
+    configured rate are not paced, but are still paused when throttled.
+    """
+
+    def __init__(self, rates=None):
+        self.rates = {family: float(rate) for family, rate in (rates or {}).items()}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+
+    def family(self, path):
+        matches = [family for family in self.rates if path == family or path.startswith(family + "/")]
+        if matches:
+            return max(matches, key=len)
+        return path.split("/", 1)[0]
+
+
+    def _bucket(self, family):
+        with self._lock:
+            bucket = self._buckets.get(family)
+            if bucket is None:
+                rate = self.rates.get(family)
+                bucket = TokenBucket(rate / 60.0 if rate else None)
+                self._buckets[family] = bucket
+            return bucket
+
+
+    def acquire(self, path):
+        return self._bucket(self.family(path)).acquire()
+
+
+    def throttled(self, path, retry_after=None):
+        """ Record a 429 for `path`, pausing its family for the server's retry hint. """
+        if retry_after:
+            family = self.family(path)
+            LOGGER.info("Rate limited on {}, pausing requests for {} seconds".format(family, retry_after))
+            self._bucket(family).pause(retry_after)
+
+
+def parse_retry_after(value):
+    """ Seconds to wait from a `Retry-After` header (delta-seconds or HTTP-date), or None. """
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def retry_after_expo(base=2, factor=1, max_value=None):
+    """
+    `backoff` wait generator: waits for the `retry_after` hint carried by the
+    exception when the server sent one, otherwise follows `backoff.expo`.
+    """
+    expo = backoff.expo(base=base, factor=factor, max_value=max_value)
+    next(expo)
+    exception = yield
+    while True:
+        retry_after = getattr(exception, "retry_after", None)
+        if retry_after is None:
+            exception = yield next(expo)
+        else:
+            exception = yield retry_after
@@ -9,23 +9,44 @@ import datetime
 import pytz
 import singer
 import time
-import tempfile
 from singer import metadata
 from singer import utils
 from dateutil.parser import parse
+from tap_iterable.checkpoint import WindowCheckpointer
 from tap_iterable.context import Context
+from tap_iterable.pipeline import pipelined_export_windows, get_spill_codec, DEFAULT_BUFFER_SIZE_MB
+from tap_iterable.window_planner import WindowPlanner, WINDOW_BOOKMARK_KEY, DEFAULT_MIN_WINDOW_IN_DAYS, \
+    DEFAULT_MAX_WINDOW_IN_DAYS, DEFAULT_TARGET_WINDOW_RECORDS, DEFAULT_TARGET_WINDOW_MB
 from tap_iterable.exceptions import IterableForbiddenError
 import tap_iterable.helper as helper
+from tap_iterable import timing
+import tap_iterable.writer as writer
 
 
 LOGGER = singer.get_logger()
 KEY_PROPERTIES = ['id']
+DEFAULT_EXPORT_WINDOW_CONCURRENCY = 1
+DEFAULT_EXPORT_BATCH_SIZE_KB = 1024
 
 
 def get_abs_path(path):
     return os.path.join(os.path.dirname(os.path.realpath(__file__)), path)
 
 
+def parse_export_record(line, projected_fields=None):
+    """ A data export record from one line of the response. """
+    rec = helper.loads(line)
+    if projected_fields is not None:
+        # Drop unselected fields before any other work, e.g. decoding
+        # `transactionalData` when it is not selected.
+        rec = {key: value for key, value in rec.items() if key in projected_fields}
+    try:
+        rec["transactionalData"] = json.loads(rec["transactionalData"])
+    except KeyError:
+        pass
+    return rec
+
+
 class Stream():
     name = None
     replication_method = None
@@ -34,6 +55,14 @@ class Stream():
     key_properties = KEY_PROPERTIES
     session_bookmark = None
     check_access_endpoint = None
+    # Functions applied to each record before it is transformed and written.
+    record_hooks = ()
+    # Schema field names that differ from the API's, i.e. fields renamed by
+    # `record_hooks`, mapped to the name in the API response.
+    source_field_names = {}
+    # Set by `sync_stream` to the `map` of a `ProcessPool` whose workers turn
+    # batches of data export lines into encoded RECORD messages.
+    batch_processor = None
 
 
     def __init__(self, client=None):
@@ -76,19 +105,24 @@ class Stream():
             return False
 
 
+    # Session bookmarks are tracked as integer epoch microseconds, so the
+    # per-record comparison needs no string formatting or parsing.
     def is_session_bookmark_old(self, value):
         if self.session_bookmark is None:
             return True
-        # Assume value is in epoch milliseconds.
-        value_in_date_time = helper.epoch_to_datetime_string(value)
-        return utils.strptime_with_tz(value_in_date_time) > utils.strptime_with_tz(self.session_bookmark)
+        # Value is epoch milliseconds or a datetime string.
+        return helper.to_epoch_micros(value) > self.session_bookmark
 
 
     def update_session_bookmark(self, value):
-        # Assume value is epoch milliseconds.
-        value_in_date_time = helper.epoch_to_datetime_string(value)
-        if self.is_session_bookmark_old(value_in_date_time):
-            self.session_bookmark = value_in_date_time
+        # Value is epoch milliseconds or a datetime string.
+        self.track_session_bookmark(helper.to_epoch_micros(value))
+
+
+    def track_session_bookmark(self, value):
+        # Value is already in epoch microseconds.
+        if value is not None and (self.session_bookmark is None or value > self.session_bookmark):
+            self.session_bookmark = value
 
 
     # Reads and converts bookmark from state.
@@ -101,17 +135,23 @@ class Stream():
     def update_bookmark(self, state, value, name=None):
         name = self.name if not name else name
         # when `value` is None, it means to set the bookmark to None
-        # Assume value is epoch time
-        value_in_date_time = helper.epoch_to_datetime_string(value)
-        if value_in_date_time is None or self.is_bookmark_old(state, value_in_date_time, name):
-            singer.write_bookmark(state, name, self.replication_key, utils.strftime(utils.strptime_to_utc(value_in_date_time)))
+        # Otherwise value is a session bookmark (epoch microseconds) or a datetime string
+        if value is None:
+            writer.write_bookmark(state, name, self.replication_key, None)
+            return
+        if isinstance(value, str):
+            value = helper.to_epoch_micros(value)
+        if self.is_bookmark_old(state, value, name):
+            writer.write_bookmark(state, name, self.replication_key,
+                                  utils.strftime(helper.epoch_micros_to_datetime(value)))
 
 
     def is_bookmark_old(self, state, value, name=None):
-        # Assume value is epoch time.
-        value_in_date_time = helper.epoch_to_datetime_string(value)
+        # Value is a session bookmark (epoch microseconds) or a datetime string.
+        if isinstance(value, str):
+            value = helper.to_epoch_micros(value)
         current_bookmark = self.get_bookmark(state, name)
-        return utils.strptime_with_tz(value_in_date_time) >= utils.strptime_with_tz(current_bookmark)
+        return value >= helper.to_epoch_micros(current_bookmark)
 
 
     def load_schema(self):
@@ -151,7 +191,7 @@ class Stream():
                 self.update_session_bookmark(item[self.replication_key])
                 yield (self.stream, item)
             if not self.session_bookmark and bookmark:
-                self.session_bookmark = bookmark
+                self.session_bookmark = helper.to_epoch_micros(bookmark)
             self.update_bookmark(state, self.session_bookmark)
 
         else:
@@ -159,47 +199,138 @@ class Stream():
                 yield (self.stream, item)
 
 
+    def get_window_planner(self, state):
+        """
+        Returns a `WindowPlanner` when adaptive export windows are enabled,
+        starting from the window size persisted in state by the previous run.
+        """
+        config = Context.config
+        if not helper.to_bool(config.get("adaptive_export_window", False)):
+            return None
+        window_in_days = singer.get_bookmark(state, self.name, WINDOW_BOOKMARK_KEY) or self.client.api_window_in_days
+        return WindowPlanner(
+            window_in_days,
+            min_window_in_days=config.get("min_window_in_days", DEFAULT_MIN_WINDOW_IN_DAYS),
+            max_window_in_days=config.get("max_window_in_days", DEFAULT_MAX_WINDOW_IN_DAYS),
+            target_records=config.get("target_window_records", DEFAULT_TARGET_WINDOW_RECORDS),
+            target_bytes=float(config.get("target_window_mb", DEFAULT_TARGET_WINDOW_MB)) * 1024 * 1024)
+
+
+    def get_projected_fields(self):
+        """
+        API field names to request from the data export: the schema fields
+        the catalog keeps (the `Transformer` drops fields that are not
+        selected or unsupported, unless they are automatic), plus the
+        replication key and key properties. None when every field is kept.
+        """
+        if not helper.to_bool(Context.config.get("export_field_projection", True)):
+            return None
+        mdata = metadata.to_map(self.stream.metadata)
+        fields = set()
+        dropped = False
+        for name in self.stream.schema.to_dict().get("properties", {}):
+            entry = mdata.get(("properties", name), {})
+            if entry.get("inclusion") != "automatic" and \
+               (entry.get("selected") is False or entry.get("inclusion") == "unsupported"):
+                dropped = True
+            else:
+                fields.add(self.source_field_names.get(name, name))
+        if not dropped:
+            return None
+        fields.update(self.key_properties)
+        if self.replication_key:
+            fields.add(self.replication_key)
+        return fields
+
+
     def sync_data_export(self, state):
         get_generator = getattr(self.client, "get_data_export_generator")
         bookmark = self.get_bookmark(state)
-        fns = get_generator(self.data_type_name, bookmark)
-        for fn in fns:
-            res, request_end_date = fn()
+        planner = self.get_window_planner(state)
+        projected_fields = self.get_projected_fields()
+        only_fields = None
+        if projected_fields is not None:
+            # Dotted names (e.g. `offers.url`) are also requested through their
+            # top-level field, in case the API only projects top-level fields.
+            only_fields = sorted(projected_fields | {name.split(".", 1)[0] for name in projected_fields})
+            LOGGER.info("Requesting {} selected fields from the {} export".format(len(only_fields), self.data_type_name))
+        fns = get_generator(self.data_type_name, bookmark, planner, only_fields)
+        # Each window is downloaded on a background thread while its records
+        # are emitted here, and windows are emitted strictly in order so the
+        # bookmarks written below stay monotonic.
+        windows = pipelined_export_windows(
+            fns,
+            concurrency=int(Context.config.get("export_window_concurrency", DEFAULT_EXPORT_WINDOW_CONCURRENCY)),
+            max_memory_bytes=int(float(Context.config.get("export_buffer_size_mb", DEFAULT_BUFFER_SIZE_MB)) * 1024 * 1024),
+            spill_dir=Context.config.get("spill_directory"),
+            spill_codec=get_spill_codec(Context.config.get("spill_compression")))
+        checkpointer = WindowCheckpointer(Context.config.get("checkpoint_every_records"),
+                                          Context.config.get("checkpoint_every_seconds"),
+                                          Context.config.get("checkpoint_lag_seconds"))
+        batch_size = int(float(Context.config.get("export_batch_size_kb", DEFAULT_EXPORT_BATCH_SIZE_KB)) * 1024)
+
+        def checkpoint_if_due():
+            if checkpointer.rewind:
+                # An earlier checkpoint of this window may skip records on
+                # resume; go back to where the window started.
+                writer.write_bookmark(state, self.name, self.replication_key,
+                                      utils.strftime(helper.epoch_micros_to_datetime(checkpointer.window_start)))
+                writer.write_state(state)
+                checkpointer.rewound()
+            elif checkpointer.due():
+                self.update_bookmark(state, checkpointer.checkpoint_value())
+                writer.write_state(state)
+                checkpointer.checkpointed()
+
+        for window in windows:
             count = 0
             start_time = time.time()
-            with tempfile.NamedTemporaryFile() as tf:
-                for item in res.iter_lines():
-                    if item:
-                        tf.write(item)
+            parse_seconds = 0.0
+            checkpointer.start_window(helper.to_epoch_micros(self.get_bookmark(state)))
+            # Records without a replication value move the session bookmark to
+            # the end of the window, but are never checkpointed at.
+            window_end = helper.to_epoch_micros(window.request_end_date)
+            try:
+                if self.batch_processor is not None:
+                    # Records are parsed, transformed and encoded on worker
+                    # processes; each batch carries their replication values.
+                    for batch in self.batch_processor(window.iter_batches(batch_size)):
+                        for value in batch.values:
+                            self.track_session_bookmark(value)
+                            checkpointer.observe(value)
+                        if batch.missing_key:
+                            self.track_session_bookmark(window_end)
+                        count += len(batch.values)
+                        yield (self.stream, batch)
+                        checkpoint_if_due()
+                else:
+                    for line in window.iter_lines():
+                        parse_started = time.perf_counter()
+                        rec = parse_export_record(line, projected_fields)
+                        parse_seconds += time.perf_counter() - parse_started
                         count += 1
-                        tf.write(b'\n')
-                # Fix for TDL-22208
-                # The expected records were getting added to temp file but observing empty file while reading
-                # Hence, added below line to move file pointer to the beginning of a file
-                tf.seek(0)
-                write_time = time.time()
-                LOGGER.info('wrote {} records to temp file in {} seconds'.format(count, int(write_time - start_time)))
-                with open(tf.name, 'r', encoding='utf-8') as tf_reader:
-                    for line in tf_reader:
-                        # json load line with line feed removed, but
-                        # sometimes the last line does not end with a line
-                        # feed, so check
-                        if line[-1] == '\n':
-                            rec = json.loads(line[:-1])
+                        if self.replication_key in rec:
+                            value = helper.to_epoch_micros(rec[self.replication_key])
+                            self.track_session_bookmark(value)
                         else:
-                            rec = json.loads(line)
-                        try:
-                            rec["transactionalData"] = json.loads(rec["transactionalData"])
-                        except KeyError:
-                            pass
-                        self.update_session_bookmark(rec.get(self.replication_key, request_end_date))
+                            value = None
+                            self.track_session_bookmark(window_end)
+                        checkpointer.observe(value)
                         yield (self.stream, rec)
-                LOGGER.info('Read and emitted {} records from temp file in {} seconds'.format(count, int(time.time() - write_time)))
+                        # The record has been written once the generator resumes.
+                        checkpoint_if_due()
+            finally:
+                window.close()
+                timing.add("parse", parse_seconds)
+            LOGGER.info('Read and emitted {} records in {} seconds'.format(count, int(time.time() - start_time)))
 
             if not self.session_bookmark and bookmark :
-                self.session_bookmark = bookmark
+                self.session_bookmark = helper.to_epoch_micros(bookmark)
             self.update_bookmark(state, self.session_bookmark)
-            singer.write_state(state)
+            if planner is not None:
+                planner.observe(count, window.bytes_received)
+                writer.write_bookmark(state, self.name, WINDOW_BOOKMARK_KEY, planner.window_in_days)
+            writer.write_state(state)
 
 
 class Lists(Stream):
@@ -343,6 +474,9 @@ class Users(Stream):
     key_properties = ["email"]
     replication_key = "profileUpdatedAt"
     data_type_name = "user"
+    # Prefix case-sensitive field names, as they cause validation issues.
+    record_hooks = (helper.transform_case_sensitive_fields,)
+    source_field_names = {field: source for source, field in helper.CASE_SENSITIVE_FIELD_MAP.items()}
 
     def sync(self, state):
         return self.sync_data_export(state)
@@ -2,16 +2,34 @@
 # Module dependencies.
 #
 
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import json
+import threading
+import time
 import singer
 import singer.metrics as metrics
 from singer import metadata
 from singer import Transformer
-from tap_iterable.helper import transform_case_sensitive_fields
-from tap_iterable.streams import STREAMS
+from tap_iterable.context import Context
+from tap_iterable.datetimes import DatetimeConverter
+from tap_iterable.helper import to_bool, to_epoch_micros
+from tap_iterable.pipeline import batch_lines
+from tap_iterable.process_pool import InlinePool, ProcessPool
+from tap_iterable.streams import STREAMS, parse_export_record
+from tap_iterable.transform import compile_record_transform, compile_passthrough_check, Fallback
+from tap_iterable import timing
+import tap_iterable.writer as writer
 
 LOGGER = singer.get_logger()
 
+DEFAULT_STREAM_CONCURRENCY = 1
+DEFAULT_EXPORT_PROCESSES = 1
+
+
+class SyncStopped(Exception):
+    """ Raised in a stream being synced concurrently once another stream has failed. """
+
 def stream_is_selected(mdata):
     return mdata.get((), {}).get('selected', False)
 
@@ -25,44 +43,299 @@ def get_selected_streams(catalog):
 
 def sync(client, catalog, state):
     selected_stream_names = get_selected_streams(catalog)
+    timing.reset()
 
+    streams = []
     for stream in catalog.get_selected_streams(state):
-        stream_name = stream.tap_stream_id
-
-        mdata = metadata.to_map(stream.metadata)
-
-        if stream_name not in selected_stream_names:
-            LOGGER.info("%s: Skipping - not selected", stream_name)
+        if stream.tap_stream_id not in selected_stream_names:
+            LOGGER.info("%s: Skipping - not selected", stream.tap_stream_id)
             continue
+        streams.append(stream)
 
-        key_properties = metadata.get(mdata, (), 'table-key-properties')
-        singer.write_schema(stream_name, stream.schema.to_dict(), key_properties)
-        LOGGER.info("%s: Starting sync", stream_name)
-        state = singer.set_currently_syncing(state, stream_name)
-        singer.write_state(state)
-        instance = STREAMS[stream_name](client)
-        instance.stream = stream
-        counter_value = sync_stream(state, instance)
-        LOGGER.info("%s: Completed sync (%s rows)", stream_name, counter_value)
-    state = singer.set_currently_syncing(state, None)
-    singer.write_state(state)
+    concurrency = int(Context.config.get("stream_concurrency", DEFAULT_STREAM_CONCURRENCY))
+    if concurrency > 1:
+        sync_concurrently(client, streams, state, concurrency)
+    else:
+        for stream in streams:
+            state = writer.set_currently_syncing(state, stream.tap_stream_id)
+            writer.write_state(state)
+            sync_catalog_stream(client, stream, state)
+    state = writer.set_currently_syncing(state, None)
+    writer.write_state(state)
+    summary = timing.summary()
+    if summary:
+        LOGGER.info("Seconds per stage:\n%s", summary)
     LOGGER.info("Finished sync")
 
 
-def sync_stream(state, instance):
-    stream = instance.stream
+def sync_concurrently(client, streams, state, concurrency):
+    """
+    Sync up to `concurrency` streams at a time. All output goes through the
+    serialized `writer`, so each stream's messages keep their order, and
+    `currently_syncing` holds the sorted list of streams in flight.
+
+    When a stream fails, the streams in flight stop at their next record
+    (their last checkpoint stays in the state) and the error is raised
+    without waiting for them to finish.
+    """
+    # A previous concurrent run that was interrupted left a list of streams
+    # in `currently_syncing`; resume those first.
+    interrupted = singer.get_currently_syncing(state)
+    if isinstance(interrupted, list):
+        streams = sorted(streams, key=lambda stream: stream.tap_stream_id not in interrupted)
+
+    in_flight = set()
+    stop = threading.Event()
+
+    def set_in_flight(stream_name, syncing):
+        with writer.LOCK:
+            if syncing:
+                in_flight.add(stream_name)
+            else:
+                in_flight.discard(stream_name)
+            writer.set_currently_syncing(state, sorted(in_flight) or None)
+            writer.write_state(state)
+
+    def run(stream):
+        set_in_flight(stream.tap_stream_id, True)
+        sync_catalog_stream(client, stream, state, stop)
+        set_in_flight(stream.tap_stream_id, False)
+
+    LOGGER.info("Syncing %s streams with up to %s at a time", len(streams), concurrency)
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    futures = []
+    try:
+        futures = [executor.submit(run, stream) for stream in streams]
+        for future in as_completed(futures):
+            future.result()
+    except Exception:
+        stop.set()
+        for future in futures:
+            future.cancel()
+        raise
+    finally:
+        executor.shutdown(wait=True)
+
+
+def sync_catalog_stream(client, stream, state, stop=None):
+    stream_name = stream.tap_stream_id
+    mdata = metadata.to_map(stream.metadata)
+    key_properties = metadata.get(mdata, (), 'table-key-properties')
+    writer.write_schema(stream_name, stream.schema.to_dict(), key_properties)
+    LOGGER.info("%s: Starting sync", stream_name)
+    instance = STREAMS[stream_name](client)
+    instance.stream = stream
+    with timing.track(stream_name) as timer:
+        counter_value = sync_stream(state, instance, stop)
+        timer.records = counter_value
+    LOGGER.info("%s: Completed sync (%s rows)", stream_name, counter_value)
+
+
+class PreparedStream():
+    """
+    Everything `sync_stream` needs per record that is constant for a stream:
+    the schema dict, the metadata map, the stream's record hooks and one
+    `Transformer` reused for every record. Unless `compiled_transform` is
+    disabled, records are converted by a transform compiled from the schema
+    once, with the `Transformer` handling whatever it falls back on, and
+    date-times by a memoizing `DatetimeConverter`.
+    """
+
+    def __init__(self, tap_stream_id, schema, mdata, record_hooks=(), compiled_transform=True):
+        self.tap_stream_id = tap_stream_id
+        self.schema = schema
+        self.mdata = mdata
+        self.record_hooks = record_hooks
+        self.transformer = Transformer(integer_datetime_fmt="unix-milliseconds-integer-datetime-parsing")
+        self.datetimes = DatetimeConverter(self.transformer)
+        self.datetime_fields = [key for key, subschema in schema.get("properties", {}).items()
+                                if subschema.get("format") == "date-time"]
+        self.compiled = None
+        if compiled_transform:
+            self.compiled = compile_record_transform(self.schema, self.mdata, self.transformer, self.datetimes)
+
+    @classmethod
+    def for_instance(cls, instance):
+        return cls(instance.stream.tap_stream_id,
+                   instance.stream.schema.to_dict(),
+                   metadata.to_map(instance.stream.metadata),
+                   instance.record_hooks,
+                   to_bool(Context.config.get("compiled_transform", True)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.transformer.log_warning()
+
+    def prime(self, records):
+        """ Convert the top-level date-times of `records` in one batch, ahead of `transform`. """
+        if self.compiled is not None and self.datetime_fields:
+            self.datetimes.prime(record.get(key) for record in records if isinstance(record, dict)
+                                 for key in self.datetime_fields)
+
+    def transform(self, record):
+        for hook in self.record_hooks:
+            record = hook(record)
+        if self.compiled is not None:
+            try:
+                return self.compiled(record)
+            except Fallback:
+                pass
+        return self.transformer.transform(record, self.schema, self.mdata)
+
+    def merge(self, batch):
+        """ Take over the fields a worker's transformer filtered or removed, for `log_warning`. """
+        self.transformer.filtered.update(batch.filtered)
+        self.transformer.removed.update(batch.removed)
+
+
+# Encoded RECORD messages for a batch of data export lines, the replication
+# values (epoch microseconds, None where missing) of those records, whether
+# any record lacks the replication key, the fields the transform filtered or
+# removed, and seconds spent per stage.
+ProcessedBatch = namedtuple("ProcessedBatch", ["data", "values", "missing_key", "filtered", "removed", "seconds"])
+
+
+class BatchProcessor():
+    """
+    Runs on `ProcessPool` workers (or inline): parses, transforms and encodes
+    batches of data export lines of one stream, the work `sync_data_export`
+    and `sync_stream` otherwise do record by record.
+
+    With `raw_passthrough`, records the transform would not change (besides
+    rewriting export date-times) are written as the JSON they arrived as,
+    instead of being transformed and encoded again. Records with a
+    `transactionalData` string to decode, or with one of the `renamed_fields`
+    a record hook renames, take the full path.
+    """
+
+    def __init__(self, prepared_args, projected_fields, replication_key, fast_json,
+                 raw_passthrough=False, renamed_fields=()):
+        self.prepared = PreparedStream(*prepared_args)
+        self.projected_fields = projected_fields
+        self.replication_key = replication_key
+        self.fast_json = fast_json
+        self.passthrough = None
+        if raw_passthrough and projected_fields is None:
+            self.passthrough = compile_passthrough_check(self.prepared.schema, self.prepared.mdata,
+                                                         self.prepared.transformer)
+        self.skip_passthrough = frozenset(renamed_fields) | {"transactionalData"}
+
+    def encode_raw(self, line, rec):
+        """ The RECORD message for `rec` from its original `line`, or None if it must be transformed. """
+        if self.passthrough is None or not self.skip_passthrough.isdisjoint(rec):
+            return None
+        rewrites = self.passthrough(rec)
+        if rewrites is None:
+            return None
+        line = line.strip()
+        for value, transformed in set(rewrites):
+            quoted = ('"' + value + '"').encode("utf-8")
+            # Only rewrite the date-time if it appears nowhere else, e.g. in
+            # a string field, which must be left as is.
+            if line.count(quoted) != rewrites.count((value, transformed)):
+                return None
+            line = line.replace(quoted, ('"' + transformed + '"').encode("utf-8"))
+        return writer.encode_raw_record(self.prepared.tap_stream_id, line)
+
+    def __call__(self, data):
+        chunks = []
+        values = []
+        missing_key = False
+        started = time.perf_counter()
+        lines = list(batch_lines(data))
+        recs = []
+        for line in lines:
+            rec = parse_export_record(line, self.projected_fields)
+            if self.replication_key in rec:
+                values.append(to_epoch_micros(rec[self.replication_key]))
+            else:
+                values.append(None)
+                missing_key = True
+            recs.append(rec)
+        parsed = time.perf_counter()
+        parse_seconds = parsed - started
+        self.prepared.prime(recs)
+        transform_seconds = time.perf_counter() - parsed
+        write_seconds = 0.0
+        for line, rec in zip(lines, recs):
+            started = time.perf_counter()
+            encoded = self.encode_raw(line, rec)
+            if encoded is not None:
+                transformed = started
+            else:
+                record = self.prepared.transform(rec)
+                transformed = time.perf_counter()
+                encoded = writer.encode_record(self.prepared.tap_stream_id, record, self.fast_json)
+            chunks.append(encoded)
+            transform_seconds += transformed - started
+            write_seconds += time.perf_counter() - transformed
+        transformer = self.prepared.transformer
+        filtered, removed = set(transformer.filtered), set(transformer.removed)
+        transformer.filtered.clear()
+        transformer.removed.clear()
+        return ProcessedBatch(b"".join(chunks), values, missing_key, filtered, removed,
+                              {"parse": parse_seconds, "transform": transform_seconds, "write": write_seconds})
+
+
+def start_batch_pool(instance, prepared):
+    """
+    For a data export stream whose records are processed in batches of
+    lines, the pool doing it: a `ProcessPool` when `export_processes` is
+    above 1, an `InlinePool` for `raw_passthrough` alone. Otherwise None.
+    """
+    if not getattr(instance, "data_type_name", None):
+        return None
+    processes = int(Context.config.get("export_processes", DEFAULT_EXPORT_PROCESSES))
+    raw_passthrough = to_bool(Context.config.get("raw_passthrough", False))
+    if processes <= 1 and not raw_passthrough:
+        return None
+    prepared_args = (prepared.tap_stream_id, prepared.schema, prepared.mdata, prepared.record_hooks,
+                     prepared.compiled is not None)
+    args = (prepared_args, instance.get_projected_fields(), instance.replication_key, writer.fast_json_enabled(),
+            raw_passthrough, set(instance.source_field_names.values()))
+    if processes <= 1:
+        return InlinePool(BatchProcessor, args)
+    LOGGER.info("%s: Processing records on %s processes", prepared.tap_stream_id, processes)
+    return ProcessPool(processes, BatchProcessor, args)
 
-    with metrics.record_counter(stream.tap_stream_id) as counter:
-        for (stream, record) in instance.sync(state):
-            counter.increment()
-            if stream.tap_stream_id == "users":  # Specific check for users as it is causing validation issues
-                record = transform_case_sensitive_fields(record=record)
 
-            with Transformer(integer_datetime_fmt="unix-milliseconds-integer-datetime-parsing") as transformer:
-                record = transformer.transform(record, stream.schema.to_dict(), metadata.to_map(stream.metadata))
-                singer.write_record(stream.tap_stream_id, record)
+def sync_stream(state, instance, stop=None):
+    with metrics.record_counter(instance.stream.tap_stream_id) as counter, \
+         PreparedStream.for_instance(instance) as prepared:
+        pool = start_batch_pool(instance, prepared)
+        if pool is not None:
+            instance.batch_processor = pool.map
+        transform_seconds = 0.0
+        write_seconds = 0.0
+        try:
+            for (_, record) in instance.sync(state):
+                if stop is not None and stop.is_set():
+                    raise SyncStopped()
+                if isinstance(record, ProcessedBatch):
+                    counter.increment(len(record.values))
+                    prepared.merge(record)
+                    for stage, seconds in record.seconds.items():
+                        timing.add(stage, seconds)
+                    started = time.perf_counter()
+                    writer.write_encoded_records(record.data)
+                    write_seconds += time.perf_counter() - started
+                    continue
+                counter.increment()
+                started = time.perf_counter()
+                record = prepared.transform(record)
+                transformed = time.perf_counter()
+                writer.write_record(prepared.tap_stream_id, record)
+                transform_seconds += transformed - started
+                write_seconds += time.perf_counter() - transformed
+        finally:
+            timing.add("transform", transform_seconds)
+            timing.add("write", write_seconds)
+            if pool is not None:
+                pool.close()
 
         if instance.replication_method == "INCREMENTAL":
-            singer.write_state(state)
+            writer.write_state(state)
 
         return counter.value
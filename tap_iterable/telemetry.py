@@ -0,0 +1,208 @@
+#
+# Module dependencies.
+#
+
+from collections import OrderedDict
+import bisect
+import os
+import tempfile
+import threading
+import singer
+import singer.metrics as metrics
+
+
+LOGGER = singer.get_logger()
+
+# Upper bounds (seconds) of the latency histogram buckets, Prometheus style.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900)
+
+METRIC_PREFIX = "tap_iterable_http_"
+
+_ENDPOINTS = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def endpoint_name(path):
+    """
+    Label for a request path. Path parameters are replaced by placeholders,
+    so e.g. every metadata key lookup is counted under one endpoint.
+    """
+    parts = path.split("/")
+    if parts[0] == "metadata" and len(parts) > 1:
+        return "/".join(["metadata", "{table}", "{key}"][:len(parts)])
+    return path
+
+
+class Histogram():
+    """ Cumulative-bucket histogram of observed seconds. """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+    def cumulative(self):
+        """ (upper bound, observations <= bound) pairs, ending with "+Inf". """
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class EndpointStats():
+    """ Counters and latency histograms of the requests made to one endpoint. """
+
+    def __init__(self):
+        self.responses = {}
+        self.time_to_first_byte = Histogram()
+        self.transfer = Histogram()
+        self.bytes = 0
+        self.retries = 0
+        self.throttled = 0
+        self.backoff_seconds = 0.0
+        self.rate_limit_wait_seconds = 0.0
+
+
+def _stats(endpoint):
+    # Callers hold `_LOCK`.
+    stats = _ENDPOINTS.get(endpoint)
+    if stats is None:
+        stats = _ENDPOINTS[endpoint] = EndpointStats()
+    return stats
+
+
+def record_response(endpoint, status_code, seconds):
+    """ A response's headers arrived `seconds` after the request was sent. """
+    with _LOCK:
+        stats = _stats(endpoint)
+        stats.responses[status_code] = stats.responses.get(status_code, 0) + 1
+        stats.time_to_first_byte.observe(seconds)
+        if status_code == 429:
+            stats.throttled += 1
+
+
+def record_transfer(endpoint, seconds, size):
+    """ A response body of `size` bytes took `seconds` to read. """
+    with _LOCK:
+        stats = _stats(endpoint)
+        stats.transfer.observe(seconds)
+        stats.bytes += size
+
+
+def record_backoff(endpoint, seconds):
+    """ `backoff` is about to sleep `seconds` before retrying a request. """
+    with _LOCK:
+        stats = _stats(endpoint)
+        stats.retries += 1
+        stats.backoff_seconds += seconds
+
+
+def record_rate_limit_wait(endpoint, seconds):
+    """ The client's rate limiter held a request back for `seconds`. """
+    if seconds:
+        with _LOCK:
+            _stats(endpoint).rate_limit_wait_seconds += seconds
+
+
+def reset():
+    with _LOCK:
+        _ENDPOINTS.clear()
+
+
+def emit_metrics():
+    """
+    Logs the retries, 429 responses and time spent waiting of every endpoint
+    that had any as Singer metrics. Request durations are logged as
+    `http_request_duration` timers as requests complete.
+    """
+    with _LOCK:
+        endpoints = [(endpoint, stats.retries, stats.throttled, stats.backoff_seconds,
+                      stats.rate_limit_wait_seconds) for endpoint, stats in _ENDPOINTS.items()]
+    for endpoint, retries, throttled, backoff_seconds, wait_seconds in endpoints:
+        tags = {metrics.Tag.endpoint: endpoint}
+        if retries:
+            metrics.log(LOGGER, metrics.Point("counter", "http_retries", retries, tags))
+            metrics.log(LOGGER, metrics.Point("timer", "http_backoff", round(backoff_seconds, 6), tags))
+        if throttled:
+            metrics.log(LOGGER, metrics.Point("counter", "http_throttled", throttled, tags))
+        if wait_seconds:
+            metrics.log(LOGGER, metrics.Point("timer", "http_rate_limit_wait", round(wait_seconds, 6), tags))
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def prometheus_text():
+    """ Snapshot of all endpoints in the Prometheus text exposition format. """
+    with _LOCK:
+        endpoints = list(_ENDPOINTS.items())
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append("# HELP {}{} {}".format(METRIC_PREFIX, name, help_text))
+            lines.append("# TYPE {}{} {}".format(METRIC_PREFIX, name, kind))
+            for suffix, labels, value in samples:
+                label_text = ",".join('{}="{}"'.format(key, _label(val)) for key, val in labels)
+                lines.append("{}{}{}{{{}}} {}".format(METRIC_PREFIX, name, suffix, label_text, _format_number(value)))
+
+        def histogram(attribute):
+            samples = []
+            for endpoint, stats in endpoints:
+                hist = getattr(stats, attribute)
+                for bound, count in hist.cumulative():
+                    samples.append(("_bucket", [("endpoint", endpoint), ("le", bound)], count))
+                samples.append(("_sum", [("endpoint", endpoint)], hist.sum))
+                samples.append(("_count", [("endpoint", endpoint)], hist.count))
+            return samples
+
+        def counter(attribute):
+            return [("", [("endpoint", endpoint)], getattr(stats, attribute)) for endpoint, stats in endpoints]
+
+        family("requests_total", "counter", "Responses received, by status code.",
+               [("", [("endpoint", endpoint), ("code", code)], count)
+                for endpoint, stats in endpoints for code, count in sorted(stats.responses.items())])
+        family("time_to_first_byte_seconds", "histogram", "Seconds from sending a request to receiving its headers.",
+               histogram("time_to_first_byte"))
+        family("transfer_seconds", "histogram", "Seconds spent reading response bodies.",
+               histogram("transfer"))
+        family("response_bytes_total", "counter", "Response body bytes read, after decompression.",
+               counter("bytes"))
+        family("retries_total", "counter", "Requests retried after an error.", counter("retries"))
+        family("throttled_total", "counter", "Responses with status 429.", counter("throttled"))
+        family("backoff_seconds_total", "counter", "Seconds slept before retrying requests.",
+               counter("backoff_seconds"))
+        family("rate_limit_wait_seconds_total", "counter", "Seconds requests were held back by the rate limiter.",
+               counter("rate_limit_wait_seconds"))
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus_textfile(path):
+    """
+    Writes `prometheus_text()` to `path` (e.g. for node_exporter's textfile
+    collector). The file is replaced atomically, so it is never read half
+    written.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(prometheus_text())
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
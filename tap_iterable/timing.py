@@ -0,0 +1,102 @@
+#
+# Module dependencies.
+#
+
+from collections import OrderedDict
+import contextlib
+import contextvars
+import threading
+import singer
+import singer.metrics as metrics
+
+
+LOGGER = singer.get_logger()
+
+# Stages of the sync path, in pipeline order:
+# - http_wait: from sending a request until its response headers arrive
+# - download: reading response bodies (including gzip decoding)
+# - spill_write: writing export data that the emitter could not keep up with to disk
+# - parse: decoding JSON records
+# - transform: record hooks and schema transform
+# - write: serializing and writing RECORD messages to stdout
+STAGES = ("http_wait", "download", "spill_write", "parse", "transform", "write")
+
+# The timer of the stream being synced. Work handed to other threads runs in
+# a copy of the submitting context (see `submit`), so it is timed as well.
+_CURRENT = contextvars.ContextVar("stage_timer", default=None)
+
+_TIMERS = OrderedDict()
+_TIMERS_LOCK = threading.Lock()
+
+
+class StageTimer():
+    """ Seconds spent (and bytes handled) per stage while syncing one stream. """
+
+    def __init__(self, stream_name):
+        self.stream_name = stream_name
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.bytes = dict.fromkeys(STAGES, 0)
+        self.records = 0
+        self._lock = threading.Lock()
+
+
+    def add(self, stage, seconds, size=0):
+        with self._lock:
+            self.seconds[stage] += seconds
+            self.bytes[stage] += size
+
+
+    def emit_metrics(self):
+        """ One `stage_duration` timer per stage, plus byte counters, as Singer metrics. """
+        for stage in STAGES:
+            tags = {metrics.Tag.endpoint: self.stream_name, "stage": stage}
+            metrics.log(LOGGER, metrics.Point("timer", "stage_duration", round(self.seconds[stage], 6), tags))
+            if self.bytes[stage]:
+                metrics.log(LOGGER, metrics.Point("counter", "stage_bytes", self.bytes[stage], tags))
+
+
+def add(stage, seconds, size=0):
+    """ Add to the current stream's timer, if any. """
+    timer = _CURRENT.get()
+    if timer is not None:
+        timer.add(stage, seconds, size)
+
+
+@contextlib.contextmanager
+def track(stream_name):
+    """ Time the stages of everything run for `stream_name` within this block. """
+    timer = StageTimer(stream_name)
+    with _TIMERS_LOCK:
+        _TIMERS[stream_name] = timer
+    token = _CURRENT.set(timer)
+    try:
+        yield timer
+    finally:
+        _CURRENT.reset(token)
+        timer.emit_metrics()
+
+
+def submit(executor, fn, *args):
+    """ `executor.submit`, running `fn` in a copy of the caller's context. """
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def reset():
+    with _TIMERS_LOCK:
+        _TIMERS.clear()
+
+
+def summary():
+    """ Table of seconds per stage for every stream synced since `reset()`. """
+    with _TIMERS_LOCK:
+        timers = list(_TIMERS.values())
+    if not timers:
+        return ""
+    rows = [("stream", "records") + STAGES + ("MB received",)]
+    for timer in timers:
+        rows.append((timer.stream_name, str(timer.records)) +
+                    tuple("{:.2f}".format(timer.seconds[stage]) for stage in STAGES) +
+                    ("{:.1f}".format(timer.bytes["download"] / 1e6),))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join("  ".join(cell.ljust(widths[i]) if i == 0 else cell.rjust(widths[i])
+                               for i, cell in enumerate(row)) for row in rows)
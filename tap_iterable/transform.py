@@ -0,0 +1,404 @@
+#
+# Module dependencies.
+#
+
+import math
+from singer.transform import breadcrumb_path
+from tap_iterable.datetimes import DatetimeConverter, transform_export_datetime
+
+
+# Returned by a converter when a value does not match its schema.
+_FAIL = object()
+
+
+class Fallback(Exception):
+    """
+    Raised by a compiled transform for records it cannot convert exactly the
+    way `singer.Transformer` would (e.g. a value that does not match the
+    schema, which `Transformer` reports with its own error messages).
+    """
+
+
+class UnsupportedSchema(Exception):
+    pass
+
+
+def compile_record_transform(schema, mdata, transformer, convert_datetime=None):
+    """
+    Compiles a stream's schema and metadata into a function converting one
+    record, with the same result as `transformer.transform(record, schema,
+    mdata)`: unselected and unsupported fields dropped, values coerced to the
+    first matching type (null last), date-times parsed with the transformer's
+    `integer_datetime_fmt` (through `convert_datetime`, by default a new
+    `DatetimeConverter`) and fields missing from the schema removed. The
+    paths the transformer would have logged as filtered or removed are added
+    to its sets.
+
+    The schema is walked once here instead of once per record. The function
+    never modifies the record and raises `Fallback` whenever the generic
+    transform would have recorded an error, so the caller can rerun the
+    record through `transformer` and fail (or log) exactly as before.
+
+    Returns None for schemas or metadata the compiler does not handle
+    (`$ref`, `patternProperties`, nested field selection), which keep using
+    the generic transform.
+    """
+    if transformer.pre_hook is not None:
+        return None
+    try:
+        dropped = _top_level_drops(mdata or {})
+        convert = _compile(schema, transformer, convert_datetime or DatetimeConverter(transformer))
+    except UnsupportedSchema:
+        return None
+
+    filtered = transformer.filtered
+
+    def transform(record):
+        if dropped:
+            if not isinstance(record, dict):
+                raise Fallback()
+            kept = {}
+            for key, value in record.items():
+                if key in dropped:
+                    filtered.add(key)
+                else:
+                    kept[key] = value
+            record = kept
+        result = convert(record, ())
+        if result is _FAIL:
+            raise Fallback()
+        return result
+
+    return transform
+
+
+def _top_level_drops(mdata):
+    """ Fields `Transformer.filter_data_by_metadata` removes from a record. """
+    dropped = set()
+    for breadcrumb, entry in mdata.items():
+        if entry.get("inclusion") == "automatic":
+            continue
+        if entry.get("selected") is False or entry.get("inclusion") == "unsupported":
+            if len(breadcrumb) != 2 or breadcrumb[0] != "properties":
+                # Fields nested in objects or arrays are filtered by walking the
+                # data rather than the schema; leave those to the generic path.
+                raise UnsupportedSchema()
+            if breadcrumb_path(breadcrumb) != breadcrumb[1]:
+                # Names containing "properties." or ".items" are logged mangled.
+                raise UnsupportedSchema()
+            dropped.add(breadcrumb[1])
+    return dropped
+
+
+def _path_str(path, key):
+    return ".".join(map(str, path + (key,)))
+
+
+def _compile(schema, transformer, convert_datetime):
+    """
+    Converter for one schema node: a function of (value, path) returning the
+    converted value, or `_FAIL` if no type matches. `path` is only used to
+    report removed fields.
+    """
+    if "$ref" in schema or "patternProperties" in schema:
+        raise UnsupportedSchema()
+    if "anyOf" in schema:
+        return _compile_any_of([_compile(subschema, transformer, convert_datetime) for subschema in schema["anyOf"]])
+    if "type" not in schema:
+        return lambda value, path: value
+
+    types = schema["type"]
+    types = list(types) if isinstance(types, list) else [types]
+    if "null" in types:
+        types.remove("null")
+        types.append("null")
+
+    attempts = [_compile_type(typ, schema, transformer, convert_datetime) for typ in types]
+    if len(attempts) == 1:
+        return attempts[0]
+    if len(attempts) == 2 and types[1] == "null" and types[0] != "string":
+        attempt = attempts[0]
+
+        def convert_or_null(value, path):
+            result = attempt(value, path)
+            if result is _FAIL and (value is None or value == ""):
+                return None
+            return result
+        return convert_or_null
+
+    def convert(value, path):
+        for attempt in attempts:
+            result = attempt(value, path)
+            if result is not _FAIL:
+                return result
+        return _FAIL
+    return convert
+
+
+def _compile_any_of(converters):
+    def convert(value, path):
+        for converter in converters:
+            result = converter(value, path)
+            if result is not _FAIL:
+                return result
+        return _FAIL
+    return convert
+
+
+def _compile_type(typ, schema, transformer, convert_datetime):
+    # pylint: disable=too-many-return-statements
+    if typ == "null":
+        return _to_null
+    if typ == "string" and schema.get("format") == "date-time":
+        return _datetime_converter(convert_datetime)
+    if typ == "string" and schema.get("format") == "singer.decimal":
+        # Not used by this tap's schemas; defer to the transformer, which
+        # records no errors for scalar types.
+        return lambda value, path: _generic(transformer, value, typ, schema)
+    if typ == "object":
+        return _compile_object(schema.get("properties", {}), transformer, convert_datetime)
+    if typ == "array":
+        if "items" not in schema:
+            raise UnsupportedSchema()
+        return _compile_array(_compile(schema["items"], transformer, convert_datetime))
+    if typ == "string":
+        return _to_string
+    if typ == "integer":
+        return _to_integer
+    if typ == "number":
+        return _to_number
+    if typ == "boolean":
+        return _to_boolean
+    return lambda value, path: _FAIL
+
+
+def _generic(transformer, value, typ, schema):
+    success, result = transformer._transform(value, typ, schema, []) # pylint: disable=protected-access
+    return result if success else _FAIL
+
+
+def _compile_object(properties, transformer, convert_datetime):
+    if not properties:
+        # The transformer passes objects without properties through untouched.
+        return lambda value, path: value if isinstance(value, dict) else _FAIL
+
+    removed = transformer.removed
+    fields = {key: _compile(subschema, transformer, convert_datetime) for key, subschema in properties.items()}
+
+    def convert(value, path):
+        if not isinstance(value, dict):
+            return _FAIL
+        result = {}
+        for key, item in value.items():
+            converter = fields.get(key)
+            if converter is None:
+                removed.add(_path_str(path, key))
+                continue
+            item = converter(item, path + (key,))
+            if item is _FAIL:
+                # The transformer would record an error for this field.
+                raise Fallback()
+            result[key] = item
+        return result
+    return convert
+
+
+def _compile_array(convert_item):
+    def convert(value, path):
+        if not isinstance(value, list):
+            return _FAIL
+        result = []
+        for index, item in enumerate(value):
+            item = convert_item(item, path + (index,))
+            if item is _FAIL:
+                raise Fallback()
+            result.append(item)
+        return result
+    return convert
+
+
+def _datetime_converter(convert_datetime):
+    # The transformer's own parsing (or an exact shortcut of it), so every
+    # accepted format and every logged warning stays the same.
+    def convert(value, path):
+        result = convert_datetime(value)
+        return _FAIL if result is None else result
+    return convert
+
+
+def compile_passthrough_check(schema, mdata, transformer):
+    """
+    Compiles a check of whether `transformer.transform(record, schema, mdata)`
+    would return `record` unchanged, apart from date-times in the export
+    API's UTC format (`2023-01-02 03:04:05 +00:00`), whose transformed value
+    (`2023-01-02T03:04:05.000000Z`) is known without parsing them.
+
+    The check returns None when the transform would change the record (a
+    field is removed, a value is coerced to another type or converted to
+    null, ...), otherwise the list of `(value, transformed value)` pairs of
+    the date-times to rewrite, so the record's original JSON can be written
+    instead of re-encoding the transformed record.
+
+    Returns None for streams whose metadata drops fields and for schemas
+    the compiler does not handle.
+    """
+    if transformer.pre_hook is not None:
+        return None
+    try:
+        if _top_level_drops(mdata or {}):
+            return None
+        check = _compile_check(schema)
+    except UnsupportedSchema:
+        return None
+
+    def passthrough(record):
+        rewrites = []
+        return rewrites if check(record, rewrites) else None
+    return passthrough
+
+
+def _compile_check(schema):
+    """ Function of (value, rewrites) telling whether the value is already transformed. """
+    if "$ref" in schema or "patternProperties" in schema:
+        raise UnsupportedSchema()
+    if "anyOf" in schema:
+        return _compile_any_of_check(schema["anyOf"])
+    if "type" not in schema:
+        return lambda value, rewrites: True
+
+    types = schema["type"]
+    types = list(types) if isinstance(types, list) else [types]
+    nullable = "null" in types
+    types = [typ for typ in types if typ != "null"]
+    if len(types) != 1:
+        # With several types a value may be coerced to an earlier one.
+        raise UnsupportedSchema()
+    check = _compile_type_check(types[0], schema)
+    if not nullable:
+        return lambda value, rewrites: value is not None and check(value, rewrites)
+
+    def check_or_null(value, rewrites):
+        # "" is converted to null unless the type is string.
+        return value is None or (value != "" or types[0] == "string") and check(value, rewrites)
+    return check_or_null
+
+
+def _compile_any_of_check(subschemas):
+    """
+    Only unions of objects and arrays are handled: the transformer uses the
+    first subschema of the value's type, as the others reject it.
+    """
+    checks = {}
+    nullable = False
+    for subschema in subschemas:
+        types = subschema.get("type", [])
+        types = types if isinstance(types, list) else [types]
+        nullable = nullable or "null" in types
+        types = [typ for typ in types if typ != "null"]
+        if len(types) != 1 or types[0] not in ("object", "array"):
+            raise UnsupportedSchema()
+        checks.setdefault(dict if types[0] == "object" else list, _compile_check(subschema))
+
+    def check(value, rewrites):
+        if value is None:
+            return nullable
+        check_type = checks.get(value.__class__)
+        return check_type is not None and check_type(value, rewrites)
+    return check
+
+
+def _compile_type_check(typ, schema):
+    # pylint: disable=too-many-return-statements
+    if typ == "string" and schema.get("format") == "date-time":
+        return _check_datetime
+    if typ == "string" and "format" in schema:
+        raise UnsupportedSchema()
+    if typ == "string":
+        return lambda value, rewrites: value.__class__ is str
+    if typ == "integer":
+        return lambda value, rewrites: value.__class__ is int
+    if typ == "number":
+        # Integers would be written as floats. NaN and Infinity (accepted by
+        # the stdlib parser) are not JSON, so they are never copied as is.
+        return lambda value, rewrites: value.__class__ is float and math.isfinite(value)
+    if typ == "boolean":
+        return lambda value, rewrites: value.__class__ is bool
+    if typ == "object":
+        properties = schema.get("properties", {})
+        if not properties:
+            return lambda value, rewrites: isinstance(value, dict)
+        fields = {key: _compile_check(subschema) for key, subschema in properties.items()}
+
+        def check_object(value, rewrites):
+            if not isinstance(value, dict):
+                return False
+            for key, item in value.items():
+                check = fields.get(key)
+                if check is None or not check(item, rewrites):
+                    return False
+            return True
+        return check_object
+    if typ == "array":
+        if "items" not in schema:
+            raise UnsupportedSchema()
+        check_item = _compile_check(schema["items"])
+        return lambda value, rewrites: isinstance(value, list) and all(check_item(item, rewrites) for item in value)
+    raise UnsupportedSchema()
+
+
+def _check_datetime(value, rewrites):
+    if value.__class__ is not str:
+        return False
+    transformed = transform_export_datetime(value)
+    if transformed is None:
+        return False
+    if transformed is not value:
+        rewrites.append((value, transformed))
+    return True
+
+
+# The scalar conversions below mirror `singer.Transformer._transform`.
+# pylint: disable=bare-except
+
+def _to_null(value, path):
+    return None if value is None or value == "" else _FAIL
+
+
+def _to_string(value, path):
+    if value is None:
+        return _FAIL
+    if value.__class__ is str:
+        return value
+    try:
+        return str(value)
+    except:
+        return _FAIL
+
+
+def _to_integer(value, path):
+    if value.__class__ is int:
+        return value
+    if isinstance(value, str):
+        value = value.replace(",", "")
+    try:
+        return int(value)
+    except:
+        return _FAIL
+
+
+def _to_number(value, path):
+    if isinstance(value, str):
+        value = value.replace(",", "")
+    try:
+        return float(value)
+    except:
+        return _FAIL
+
+
+def _to_boolean(value, path):
+    if isinstance(value, str) and value.lower() == "false":
+        return False
+    try:
+        return bool(value)
+    except:
+        return _FAIL
@@ -0,0 +1,81 @@
+#
+# Module dependencies.
+#
+
+from collections import deque
+import singer
+
+
+LOGGER = singer.get_logger()
+
+DEFAULT_MIN_WINDOW_IN_DAYS = 0.1
+DEFAULT_MAX_WINDOW_IN_DAYS = 90
+DEFAULT_TARGET_WINDOW_RECORDS = 1000000
+DEFAULT_TARGET_WINDOW_MB = 1024
+# Bounds on how much a single observation may change the window size, so one
+# unusually busy or quiet window does not swing the next one too far.
+MAX_GROWTH_FACTOR = 2.0
+MAX_SHRINK_FACTOR = 0.25
+# State key, stored next to the replication key in the stream's bookmark.
+WINDOW_BOOKMARK_KEY = "window_in_days"
+
+
+class WindowPlanner():
+    """
+    Chooses the size of successive data export windows for one stream from
+    the volume returned by the windows already completed.
+
+    The client calls `plan()` when it schedules a window and the stream calls
+    `observe()` once that window has been emitted. Windows are emitted in the
+    order they were planned, so observations are matched to planned windows
+    first-in first-out even when several windows are in flight.
+    """
+
+    def __init__(self, window_in_days, min_window_in_days=DEFAULT_MIN_WINDOW_IN_DAYS,
+                 max_window_in_days=DEFAULT_MAX_WINDOW_IN_DAYS,
+                 target_records=DEFAULT_TARGET_WINDOW_RECORDS,
+                 target_bytes=DEFAULT_TARGET_WINDOW_MB * 1024 * 1024):
+        self.min_window_in_days = float(min_window_in_days)
+        self.max_window_in_days = float(max_window_in_days)
+        if self.min_window_in_days <= 0 or self.min_window_in_days > self.max_window_in_days:
+            raise ValueError("Invalid export window bounds: min {} / max {} days".format(
+                min_window_in_days, max_window_in_days))
+        self.target_records = int(target_records)
+        self.target_bytes = int(target_bytes)
+        self.window_in_days = self._clamp(float(window_in_days))
+        self._planned = deque()
+
+
+    def _clamp(self, window_in_days):
+        return min(max(window_in_days, self.min_window_in_days), self.max_window_in_days)
+
+
+    def plan(self, remaining_days):
+        """ Size in days of the next window, given the days left until now. """
+        window_in_days = min(self.window_in_days, remaining_days)
+        self._planned.append(window_in_days)
+        return window_in_days
+
+
+    def observe(self, records, bytes_received):
+        """ Adjust the window size from what the oldest planned window returned. """
+        window_in_days = self._planned.popleft() if self._planned else self.window_in_days
+        if window_in_days <= 0:
+            return self.window_in_days
+
+        # Size the window from the observed density so that the busier of the
+        # two measures hits its target. The observed window may be shorter
+        # than the current size (the last window ends at "now"), so the step
+        # is bounded relative to the current size rather than the observed one.
+        utilization = max(records / float(self.target_records),
+                          bytes_received / float(self.target_bytes))
+        ideal = window_in_days / utilization if utilization > 0 else float("inf")
+        proposed = min(max(ideal, self.window_in_days * MAX_SHRINK_FACTOR),
+                       self.window_in_days * MAX_GROWTH_FACTOR)
+        proposed = self._clamp(proposed)
+
+        if proposed != self.window_in_days:
+            LOGGER.info("Export window resized from {:.4g} to {:.4g} days ({} records, {} bytes in {:.4g} days)".format(
+                self.window_in_days, proposed, records, bytes_received, window_in_days))
+        self.window_in_days = proposed
+        return self.window_in_days
@@ -0,0 +1,150 @@
+#
+# Module dependencies.
+#
+
+import json
+import math
+import sys
+import threading
+import singer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Serializes every Singer message and every change to the shared state dict,
+# so streams synced on different threads can share one stdout and one state.
+LOCK = threading.RLock()
+
+DEFAULT_BUFFER_SIZE_KB = 1024
+
+
+class RecordBuffer():
+    """
+    Collects serialized RECORD messages and writes them to stdout in large
+    chunks. It is flushed before every SCHEMA and STATE message, so a STATE
+    is never written ahead of the records it covers.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_BUFFER_SIZE_KB * 1024, fast_json=True):
+        self.max_bytes = max_bytes
+        self.fast_json = bool(fast_json and orjson is not None)
+        self._chunks = []
+        self._size = 0
+
+
+    def encode(self, stream_name, record):
+        return encode_record(stream_name, record, self.fast_json)
+
+
+    def append(self, data):
+        self._chunks.append(data)
+        self._size += len(data)
+        if self._size >= self.max_bytes:
+            self.flush()
+
+
+    def flush(self):
+        if not self._chunks:
+            return
+        data = b"".join(self._chunks)
+        self._chunks = []
+        self._size = 0
+        stdout_buffer = getattr(sys.stdout, "buffer", None)
+        if stdout_buffer is not None:
+            # Anything written through the text layer must come out first.
+            sys.stdout.flush()
+            stdout_buffer.write(data)
+            stdout_buffer.flush()
+        else:
+            sys.stdout.write(data.decode("utf-8"))
+            sys.stdout.flush()
+
+
+def encode_record(stream_name, record, fast_json=True):
+    """ A RECORD message as the line of bytes written to stdout. """
+    message = {"type": "RECORD", "stream": stream_name, "record": record}
+    if fast_json and orjson is not None:
+        try:
+            data = orjson.dumps(message) # pylint: disable=no-member
+        except TypeError:
+            # Types orjson does not handle (e.g. Decimal) take the stdlib path.
+            data = None
+        # orjson writes NaN and Infinity as null, where singer raises; such
+        # records take the stdlib path to fail the same way.
+        if data is not None and not (b"null" in data and _has_non_finite(record)):
+            return data + b"\n"
+    message = singer.RecordMessage(stream=stream_name, record=record)
+    return (singer.format_message(message) + "\n").encode("utf-8")
+
+
+def _has_non_finite(value):
+    if value.__class__ is float:
+        return not math.isfinite(value)
+    if isinstance(value, dict):
+        return any(_has_non_finite(item) for item in value.values())
+    if isinstance(value, list):
+        return any(_has_non_finite(item) for item in value)
+    return False
+
+
+def encode_raw_record(stream_name, record_json):
+    """ A RECORD message around the JSON of a record (bytes), copied as is. """
+    return b'{"type":"RECORD","stream":' + json.dumps(stream_name).encode("utf-8") + \
+        b',"record":' + record_json + b"}\n"
+
+
+RECORD_BUFFER = RecordBuffer()
+
+
+def configure(buffer_size_kb=DEFAULT_BUFFER_SIZE_KB, fast_json=True):
+    """ Replace the record buffer; a size of 0 writes every record immediately. """
+    global RECORD_BUFFER # pylint: disable=global-statement
+    with LOCK:
+        RECORD_BUFFER.flush()
+        RECORD_BUFFER = RecordBuffer(int(float(buffer_size_kb) * 1024), fast_json)
+
+
+def flush():
+    with LOCK:
+        RECORD_BUFFER.flush()
+
+
+def write_schema(stream_name, schema, key_properties):
+    with LOCK:
+        RECORD_BUFFER.flush()
+        singer.write_schema(stream_name, schema, key_properties)
+
+
+def write_record(stream_name, record):
+    data = RECORD_BUFFER.encode(stream_name, record)
+    with LOCK:
+        RECORD_BUFFER.append(data)
+
+
+def write_encoded_records(data):
+    """ Write RECORD messages already encoded by `encode_record`, e.g. on another process. """
+    with LOCK:
+        RECORD_BUFFER.append(data)
+
+
+def fast_json_enabled():
+    return RECORD_BUFFER.fast_json
+
+
+def write_state(state):
+    with LOCK:
+        RECORD_BUFFER.flush()
+        singer.write_state(state)
+
+
+def write_bookmark(state, tap_stream_id, key, val):
+    with LOCK:
+        return singer.write_bookmark(state, tap_stream_id, key, val)
+
+
+def set_currently_syncing(state, value):
+    with LOCK:
+        return singer.set_currently_syncing(state, value)
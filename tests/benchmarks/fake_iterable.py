@@ -0,0 +1,309 @@
+"""
+A local HTTP server imitating the parts of the Iterable API the tap reads,
+serving synthetic data of configurable volume and record width.
+
+Records are generated deterministically from the stream schemas in
+`tap_iterable/schemas`, so every run of a benchmark downloads the same data.
+"""
+
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import json
+import random
+import socket
+import sys
+import threading
+import time
+import zlib
+
+from tap_iterable.streams import STREAMS
+
+
+EXPORT_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Distinct record bodies generated per export data type; records cycle through
+# them with their own replication key value.
+RECORD_VARIANTS = 256
+STREAM_CHUNK_SIZE = 64 * 1024
+TEMPLATE_TYPES = ["Base", "Blast", "Triggered", "Workflow"]
+MESSAGE_MEDIUMS = ["Email", "Push", "InApp", "SMS"]
+
+
+def value_for(schema, rng, depth=0):
+    """ A random value valid for `schema`. """
+    if "anyOf" in schema:
+        return value_for(schema["anyOf"][0], rng, depth)
+    types = schema.get("type", "string")
+    types = [t for t in (types if isinstance(types, list) else [types]) if t != "null"] or ["null"]
+    typ = types[0]
+    if typ == "string" and schema.get("format") == "date-time":
+        return "2023-{:02d}-{:02d} {:02d}:{:02d}:00 +00:00".format(
+            rng.randint(1, 12), rng.randint(1, 28), rng.randint(0, 23), rng.randint(0, 59))
+    if typ == "string":
+        return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 24)))
+    if typ == "integer":
+        return rng.randint(0, 10 ** 9)
+    if typ == "number":
+        return round(rng.uniform(0, 1000), 2)
+    if typ == "boolean":
+        return rng.random() < 0.5
+    if typ == "array":
+        if depth > 2:
+            return []
+        return [value_for(schema.get("items", {}), rng, depth + 1) for _ in range(rng.randint(0, 3))]
+    if typ == "object":
+        properties = schema.get("properties", {})
+        if depth > 2 or not properties:
+            return {"key": rng.randint(0, 100)}
+        return {key: value_for(sub, rng, depth + 1) for key, sub in properties.items()}
+    return None
+
+
+class SyntheticData():
+    """
+    The data served by the fake API.
+
+    `records_per_day` export records exist for every data export stream per
+    day, evenly spread over time and returned in `createdAt` (or
+    `profileUpdatedAt`) order. Each carries `width` fields of its schema,
+    besides its replication key and key properties.
+    """
+
+    def __init__(self, records_per_day=10000, width=20, lists=5, list_size=10000, metadata_tables=2,
+                 metadata_keys=100, templates=200, campaigns=200, seed=0):
+        self.records_per_day = float(records_per_day)
+        self.width = int(width)
+        self.lists = int(lists)
+        self.list_size = int(list_size)
+        self.metadata_tables = int(metadata_tables)
+        self.metadata_keys = int(metadata_keys)
+        self.templates = int(templates)
+        self.campaigns = int(campaigns)
+        self.seed = seed
+        self.created_at_millis = (int(time.time()) - 3600) * 1000
+        self._variants = {}
+        self._lock = threading.Lock()
+
+    def export_stream(self, data_type_name):
+        for stream_cls in STREAMS.values():
+            if getattr(stream_cls, "data_type_name", None) == data_type_name:
+                return stream_cls()
+        return None
+
+    def variants(self, data_type_name):
+        """ Pre-serialized record bodies (without the replication key) for a data type. """
+        with self._lock:
+            if data_type_name not in self._variants:
+                stream = self.export_stream(data_type_name)
+                properties = stream.load_schema()["properties"]
+                rng = random.Random("{}-{}".format(self.seed, data_type_name))
+                required = set(stream.key_properties) | {stream.replication_key}
+                optional = [name for name in sorted(properties) if name not in required]
+                variants = []
+                for i in range(RECORD_VARIANTS):
+                    names = rng.sample(optional, min(self.width, len(optional)))
+                    record = {name: value_for(properties[name], rng) for name in names}
+                    for name in stream.key_properties:
+                        record[name] = "user{}@example.com".format(i) if name == "email" else i
+                    if "email" in properties:
+                        record["email"] = "user{}@example.com".format(i)
+                    if "transactionalData" in record:
+                        record["transactionalData"] = json.dumps({"orderId": i})
+                    variants.append(record)
+                self._variants[data_type_name] = (stream.replication_key, variants)
+            return self._variants[data_type_name]
+
+    def export_lines(self, data_type_name, start, end, only_fields=None):
+        """ Newline-delimited JSON records of the export window [start, end). """
+        replication_key, variants = self.variants(data_type_name)
+        if only_fields:
+            keep = set(only_fields)
+            variants = [{k: v for k, v in record.items() if k in keep} for record in variants]
+        bodies = [json.dumps(record, separators=(",", ":"))[1:] for record in variants]
+        prefix = '{{"{}":"'.format(replication_key)
+
+        start_ts = start.timestamp()
+        end_ts = end.timestamp()
+        interval = 86400.0 / self.records_per_day
+        # Records sit on a fixed grid, so consecutive windows never overlap.
+        index = int(-(-start_ts // interval))
+        lines = []
+        size = 0
+        while index * interval < end_ts:
+            created_at = time.strftime(EXPORT_DATE_FORMAT, time.gmtime(index * interval))
+            body = bodies[index % len(bodies)]
+            line = "{}{} +00:00\"{}{}\n".format(prefix, created_at, "," if body != "}" else "", body)
+            lines.append(line)
+            size += len(line)
+            if size >= STREAM_CHUNK_SIZE:
+                yield "".join(lines).encode()
+                lines = []
+                size = 0
+            index += 1
+        if lines:
+            yield "".join(lines).encode()
+
+    def list_members(self, list_id):
+        for start in range(0, self.list_size, 1000):
+            yield "".join("member{}-{}@example.com\n".format(list_id, i)
+                          for i in range(start, min(start + 1000, self.list_size))).encode()
+
+    def _millis(self, i):
+        # Recent enough to be after any start_date a benchmark uses.
+        return self.created_at_millis + i * 1000
+
+    def lists_response(self):
+        return {"lists": [{"id": i, "name": "List {}".format(i), "createdAt": self._millis(i),
+                           "listType": "Standard"} for i in range(self.lists)]}
+
+    def campaigns_response(self):
+        return {"campaigns": [{"id": i, "name": "Campaign {}".format(i), "createdAt": self._millis(i),
+                               "updatedAt": self._millis(i + 1), "templateId": i, "messageMedium": "Email",
+                               "campaignState": "Finished", "listIds": [i % max(self.lists, 1)],
+                               "type": "Blast"} for i in range(self.campaigns)]}
+
+    def templates_response(self, template_type=None, message_medium=None):
+        templates = range(self.templates)
+        if template_type and message_medium:
+            # Every template belongs to one type/medium combination.
+            combinations = len(TEMPLATE_TYPES) * len(MESSAGE_MEDIUMS)
+            combination = TEMPLATE_TYPES.index(template_type) * len(MESSAGE_MEDIUMS) + \
+                MESSAGE_MEDIUMS.index(message_medium)
+            templates = range(combination, self.templates, combinations)
+        return {"templates": [{"templateId": i, "name": "Template {}".format(i), "createdAt": self._millis(i),
+                               "updatedAt": self._millis(i + 1), "messageTypeId": 1, "campaignId": i}
+                              for i in templates]}
+
+    def metadata_tables_response(self):
+        return {"results": [{"name": "table{}".format(i)} for i in range(self.metadata_tables)]}
+
+    def metadata_keys_response(self, table):
+        return {"results": [{"table": table, "key": "key{}".format(i)} for i in range(self.metadata_keys)]}
+
+    def metadata_value_response(self, table, key):
+        return {"table": table, "key": key, "size": 32, "lastModified": self._millis(1),
+                "value": {"field": key, "count": len(key)}}
+
+
+class FakeIterableHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # Headers and body are written separately; without this, Nagle's
+        # algorithm and delayed ACKs add ~40ms to every keep-alive request.
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        pass
+
+    def do_GET(self):
+        try:
+            self.route()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading, e.g. after an access probe.
+            self.close_connection = True
+        except Exception as exc: # pylint: disable=broad-except
+            self.send_json({"msg": repr(exc)}, status=500)
+
+    def route(self):
+        url = urlsplit(self.path)
+        path = url.path[len("/api/"):] if url.path.startswith("/api/") else url.path.lstrip("/")
+        params = parse_qs(url.query)
+        data = self.server.data
+        param = lambda name: params.get(name, [None])[0]
+
+        if path == "export/data.json":
+            start = datetime.strptime(param("startDateTime"), EXPORT_DATE_FORMAT).replace(tzinfo=timezone.utc)
+            end = datetime.strptime(param("endDateTime"), EXPORT_DATE_FORMAT).replace(tzinfo=timezone.utc)
+            if data.export_stream(param("dataTypeName")) is None:
+                return self.send_json({"msg": "Unknown dataTypeName"}, status=400)
+            return self.send_stream(data.export_lines(param("dataTypeName"), start, end, params.get("onlyFields")))
+        if path == "lists/getUsers":
+            return self.send_stream(data.list_members(int(param("listId"))), content_type="text/plain")
+        if path == "lists":
+            return self.send_json(data.lists_response())
+        if path == "campaigns":
+            return self.send_json(data.campaigns_response())
+        if path == "templates":
+            return self.send_json(data.templates_response(param("templateType"), param("messageMedium")))
+        if path == "channels":
+            return self.send_json({"channels": [{"id": 1, "name": "Email", "channelType": "Marketing",
+                                                 "messageMedium": "Email"}]})
+        if path == "messageTypes":
+            return self.send_json({"messageTypes": [{"id": 1, "name": "Newsletter", "channelId": 1,
+                                                     "subscriptionPolicy": "OptOut"}]})
+        if path == "metadata":
+            return self.send_json(data.metadata_tables_response())
+        parts = path.split("/")
+        if parts[0] == "metadata" and len(parts) == 2:
+            return self.send_json(data.metadata_keys_response(parts[1]))
+        if parts[0] == "metadata" and len(parts) == 3:
+            return self.send_json(data.metadata_value_response(parts[1], parts[2]))
+        return self.send_json({"msg": "Not found"}, status=404)
+
+    def _compressor(self):
+        if self.server.gzip and "gzip" in self.headers.get("Accept-Encoding", ""):
+            return zlib.compressobj(1, zlib.DEFLATED, 31)
+        return None
+
+    def send_json(self, body, status=200):
+        payload = json.dumps(body).encode()
+        compressor = self._compressor()
+        if compressor is not None:
+            payload = compressor.compress(payload) + compressor.flush()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        if compressor is not None:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        self.wfile.write(payload)
+        self.server.count_bytes(len(payload))
+
+    def send_stream(self, chunks, content_type="application/x-json-stream"):
+        """ Chunked transfer encoding, so the body is streamed as it is generated. """
+        compressor = self._compressor()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        if compressor is not None:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        for chunk in chunks:
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            self._write_chunk(chunk)
+        if compressor is not None:
+            self._write_chunk(compressor.flush())
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, chunk):
+        if chunk:
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.server.count_bytes(len(chunk))
+
+
+class FakeIterableServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, data, port=0, gzip=True):
+        super().__init__(("127.0.0.1", port), FakeIterableHandler)
+        self.data = data
+        self.gzip = gzip
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            # Clients closing connections early is expected, e.g. access probes.
+            return
+        super().handle_error(request, client_address)
+
+    @property
+    def base_url(self):
+        return "http://127.0.0.1:{}/api/".format(self.server_address[1])
+
+    def count_bytes(self, size):
+        with self._lock:
+            self.bytes_sent += size
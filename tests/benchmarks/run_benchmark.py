@@ -0,0 +1,284 @@
+"""
+End-to-end throughput benchmark: runs `tap_iterable.main` (discovery, then a
+sync) against a local fake Iterable API and reports records/sec, bytes/sec,
+peak RSS, the time taken by each stream and, from the tap's `stage_duration`
+metrics, the seconds each stream spent per sync stage (http_wait, download,
+parse, transform, write, ...).
+
+    python tests/benchmarks/run_benchmark.py --streams email_send,users \\
+        --records-per-day 50000 --days 30 --width 40 \\
+        --config '{"export_window_concurrency": 2}'
+
+Any tap config key can be passed through `--config`, so the same synthetic
+data can be synced with different window and concurrency settings.
+"""
+
+from datetime import datetime, timedelta, timezone
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(os.path.dirname(BENCHMARK_DIR))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+
+from fake_iterable import FakeIterableServer, SyntheticData # pylint: disable=wrong-import-position
+
+
+TAP_COMMAND = [sys.executable, "-c", "import tap_iterable; tap_iterable.main()"]
+DEFAULT_STREAMS = "email_send,users"
+
+
+def serve(conn, data_options, gzip):
+    """ Server process: reports its URL, serves until told to stop, then reports bytes sent. """
+    server = FakeIterableServer(SyntheticData(**data_options), gzip=gzip)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    conn.send(server.base_url)
+    conn.recv()
+    server.shutdown()
+    conn.send(server.bytes_sent)
+
+
+def wait_for_peak_rss_mb(process):
+    """
+    Waits for `process` to exit and returns its own peak resident set. Only
+    that process is measured, not the fake server or discovery run.
+    """
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    # Kilobytes on Linux, bytes on macOS.
+    return rusage.ru_maxrss / 1024.0 if sys.platform != "darwin" else rusage.ru_maxrss / (1024.0 * 1024.0)
+
+
+def run_discover(config_path):
+    started = time.time()
+    process = subprocess.run(TAP_COMMAND + ["-c", config_path, "-d"],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        raise Exception("Discovery failed:\n{}".format(process.stderr.decode()[-2000:]))
+    return json.loads(process.stdout), time.time() - started
+
+
+def select_streams(catalog, stream_names):
+    streams = []
+    for stream in catalog["streams"]:
+        if stream["tap_stream_id"] not in stream_names:
+            continue
+        for entry in stream["metadata"]:
+            if entry["breadcrumb"] == []:
+                entry["metadata"]["selected"] = True
+        streams.append(stream)
+    missing = set(stream_names) - {stream["tap_stream_id"] for stream in streams}
+    if missing:
+        raise Exception("Streams not in the catalog: {}".format(", ".join(sorted(missing))))
+    return {"streams": streams}
+
+
+class StreamStats():
+
+    def __init__(self):
+        self.started = None
+        self.finished = None
+        self.records = 0
+        self.bytes = 0
+
+    def seen(self, now, size, is_record):
+        if self.started is None:
+            self.started = now
+        self.finished = now
+        self.bytes += size
+        if is_record:
+            self.records += 1
+
+
+def run_sync(config_path, catalog_path, log_path):
+    """
+    Runs a sync, timing every stream from its SCHEMA message to its last
+    message, and measures the peak RSS of the sync process.
+    """
+    stats = {}
+    total_bytes = 0
+    started = time.time()
+    with open(log_path, "wb") as log:
+        process = subprocess.Popen(TAP_COMMAND + ["-c", config_path, "--catalog", catalog_path],
+                                   stdout=subprocess.PIPE, stderr=log, bufsize=1024 * 1024)
+        for line in process.stdout:
+            total_bytes += len(line)
+            # Only the message header is parsed; records are not decoded.
+            header = line[:200]
+            is_record = b'"RECORD"' in header
+            start = header.find(b'"stream"')
+            if start < 0:
+                continue
+            start = header.find(b'"', header.find(b':', start)) + 1
+            stream = header[start:header.find(b'"', start)].decode()
+            stats.setdefault(stream, StreamStats()).seen(time.time(), len(line), is_record)
+        process.stdout.close()
+        peak_rss_mb = wait_for_peak_rss_mb(process)
+        if process.returncode != 0:
+            raise Exception("Sync failed with exit code {}, see {}".format(process.returncode, log_path))
+    return stats, total_bytes, time.time() - started, peak_rss_mb
+
+
+def parse_stage_durations(log_path):
+    """ {stream: {stage: seconds}} from the `stage_duration` metrics in the tap's log. """
+    stages = {}
+    with open(log_path, "rb") as log:
+        for line in log:
+            start = line.find(b"METRIC: ")
+            if start < 0 or b'"stage_duration"' not in line:
+                continue
+            point = json.loads(line[start + len(b"METRIC: "):])
+            tags = point["tags"]
+            stages.setdefault(tags["endpoint"], {})[tags["stage"]] = point["value"]
+    return stages
+
+
+def format_stage_table(stages):
+    names = []
+    for stream_stages in stages.values():
+        names.extend(name for name in stream_stages if name not in names)
+    rows = [("stream",) + tuple(names)]
+    for stream, stream_stages in sorted(stages.items()):
+        rows.append((stream,) + tuple("{:.2f}".format(stream_stages.get(name, 0.0)) for name in names))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return ["  ".join(cell.ljust(widths[i]) if i == 0 else cell.rjust(widths[i])
+                      for i, cell in enumerate(row)) for row in rows]
+
+
+def format_report(results):
+    rows = [("stage", "seconds", "records", "records/s", "MB out", "MB/s")]
+    rows.append(("discover", "{:.2f}".format(results["discover_seconds"]), "", "", "", ""))
+    for name, stream in sorted(results["streams"].items()):
+        # Rates over a few milliseconds are meaningless.
+        timed = stream["seconds"] >= 0.1
+        rows.append((name, "{:.2f}".format(stream["seconds"]), str(stream["records"]),
+                     "{:.0f}".format(stream["records_per_second"]) if timed else "-",
+                     "{:.1f}".format(stream["mb"]),
+                     "{:.1f}".format(stream["mb_per_second"]) if timed else "-"))
+    rows.append(("sync", "{:.2f}".format(results["sync_seconds"]), str(results["records"]),
+                 "{:.0f}".format(results["records_per_second"]), "{:.1f}".format(results["mb"]),
+                 "{:.1f}".format(results["mb_per_second"])))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    lines = ["  ".join(cell.ljust(widths[i]) if i == 0 else cell.rjust(widths[i])
+                       for i, cell in enumerate(row)) for row in rows]
+    if results["stages"]:
+        lines.append("")
+        lines.append("seconds per sync stage:")
+        lines.extend(format_stage_table(results["stages"]))
+    lines.append("")
+    lines.append("served {:.1f} MB over HTTP, peak RSS of the sync {:.0f} MB".format(results["mb_served"], results["peak_rss_mb"]))
+    return "\n".join(lines)
+
+
+def run(args):
+    data_options = {
+        "records_per_day": args.records_per_day,
+        "width": args.width,
+        "lists": args.lists,
+        "list_size": args.list_size,
+        "metadata_tables": args.metadata_tables,
+        "metadata_keys": args.metadata_keys,
+        "templates": args.templates,
+        "campaigns": args.campaigns,
+        "seed": args.seed,
+    }
+    conn, child_conn = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=serve, args=(child_conn, data_options, not args.no_gzip), daemon=True)
+    server.start()
+    base_url = conn.recv()
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            start_date = datetime.now(timezone.utc) - timedelta(days=args.days)
+            config = {
+                "api_key": "benchmark",
+                "start_date": start_date.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "api_base_url": base_url,
+                "api_window_in_days": args.window_in_days,
+            }
+            config.update(json.loads(args.config))
+            config_path = os.path.join(tmp, "config.json")
+            with open(config_path, "w") as f:
+                json.dump(config, f)
+
+            catalog, discover_seconds = run_discover(config_path)
+            catalog_path = os.path.join(tmp, "catalog.json")
+            with open(catalog_path, "w") as f:
+                json.dump(select_streams(catalog, args.streams.split(",")), f)
+
+            log_path = args.log or os.path.join(tmp, "tap.log")
+            stats, total_bytes, sync_seconds, peak_rss_mb = run_sync(config_path, catalog_path, log_path)
+            stages = parse_stage_durations(log_path)
+    finally:
+        conn.send("stop")
+        bytes_served = conn.recv()
+        server.join()
+
+    streams = {}
+    for name, stream in stats.items():
+        seconds = max(stream.finished - stream.started, 1e-9)
+        streams[name] = {
+            "seconds": seconds,
+            "records": stream.records,
+            "records_per_second": stream.records / seconds,
+            "mb": stream.bytes / 1e6,
+            "mb_per_second": stream.bytes / 1e6 / seconds,
+        }
+    records = sum(stream.records for stream in stats.values())
+    return {
+        "config": config,
+        "data": data_options,
+        "discover_seconds": discover_seconds,
+        "sync_seconds": sync_seconds,
+        "records": records,
+        "records_per_second": records / sync_seconds,
+        "mb": total_bytes / 1e6,
+        "mb_per_second": total_bytes / 1e6 / sync_seconds,
+        "mb_served": bytes_served / 1e6,
+        "peak_rss_mb": peak_rss_mb,
+        "streams": streams,
+        "stages": stages,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", default=DEFAULT_STREAMS, help="comma-separated streams to sync")
+    parser.add_argument("--days", type=float, default=30, help="days between start_date and now")
+    parser.add_argument("--records-per-day", type=float, default=10000, help="export records per stream per day")
+    parser.add_argument("--width", type=int, default=20, help="schema fields per export record")
+    parser.add_argument("--window-in-days", type=float, default=10, help="api_window_in_days")
+    parser.add_argument("--lists", type=int, default=5)
+    parser.add_argument("--list-size", type=int, default=10000)
+    parser.add_argument("--metadata-tables", type=int, default=2)
+    parser.add_argument("--metadata-keys", type=int, default=100)
+    parser.add_argument("--templates", type=int, default=200)
+    parser.add_argument("--campaigns", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-gzip", action="store_true", help="serve responses uncompressed")
+    parser.add_argument("--config", default="{}", help="JSON object of extra tap config")
+    parser.add_argument("--log", help="keep the tap's log in this file")
+    parser.add_argument("--json", help="also write the results to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    print(format_report(results))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
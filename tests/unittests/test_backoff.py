@@ -46,7 +46,7 @@ class TestBackoff(unittest.TestCase):
         [503, IterableNotAvailableError, 7, "API service is currently unavailable."],
     ])
     @mock.patch("time.sleep")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_backoff(self, mock_error_code, mock_exception, mock_expected_call_count, expected_error_message, mock_get, mock_sleep):
         iterable_object = Iterable("api-key")
         mock_get.side_effect = [Mockresponse(
@@ -61,3 +61,16 @@ class TestBackoff(unittest.TestCase):
 
         # Verify the call count for each error.
         self.assertEqual(mock_get.call_count, mock_expected_call_count)
+
+    @mock.patch("time.sleep")
+    @mock.patch("requests.Session.get")
+    def test_retry_after_header_honored(self, mock_get, mock_sleep):
+        iterable_object = Iterable("api-key")
+        throttled = Mockresponse(429, {}, True, headers={"Retry-After": "3"})
+        mock_get.side_effect = [throttled, Mockresponse(200, {}, False)]
+
+        response = iterable_object._get("dummy-path")
+
+        self.assertEqual(response.status_code, 200)
+        # Waited for the server's hint instead of the exponential schedule.
+        self.assertEqual(mock_sleep.call_args_list[0], mock.call(3.0))
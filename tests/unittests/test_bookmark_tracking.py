@@ -0,0 +1,54 @@
+import unittest
+
+from singer import utils
+
+import tap_iterable.helper as helper
+from tap_iterable.context import Context
+from tap_iterable.streams import Campaigns
+
+
+class TestBookmarkTracking(unittest.TestCase):
+    """
+    Test session bookmark tracking in integer epoch microseconds.
+    """
+
+    def setUp(self):
+        self.config = Context.config
+        Context.config = {"start_date": "2023-01-01T00:00:00Z"}
+
+    def tearDown(self):
+        Context.config = self.config
+
+    def test_epoch_conversion_matches_string_formatting(self):
+        for millis in [0, 1677051075145, 1677051075999, 1700000000001]:
+            expected = utils.strftime(utils.strptime_to_utc(helper.epoch_to_datetime_string(millis)))
+            actual = utils.strftime(helper.epoch_micros_to_datetime(helper.to_epoch_micros(millis)))
+            self.assertEqual(expected, actual)
+
+    def test_string_values_accepted(self):
+        self.assertEqual(helper.to_epoch_micros("1970-01-01T00:00:01.000002Z"), 1000002)
+        self.assertEqual(helper.to_epoch_micros("2023-03-01 10:00:00 +01:00"),
+                         helper.to_epoch_micros(1677661200000))
+        self.assertIsNone(helper.to_epoch_micros(None))
+
+    def test_session_bookmark_keeps_maximum(self):
+        stream = Campaigns()
+        for value in [1677051075145, "2023-02-22 07:31:16 +00:00", 1677051074000, None]:
+            stream.update_session_bookmark(value)
+        self.assertEqual(stream.session_bookmark, helper.to_epoch_micros(1677051076000))
+        self.assertFalse(stream.is_session_bookmark_old(1677051076000))
+        self.assertTrue(stream.is_session_bookmark_old("2023-02-22T07:31:16.001Z"))
+
+    def test_update_bookmark_only_moves_forward(self):
+        stream = Campaigns()
+        state = {"bookmarks": {"campaigns": {"updatedAt": "2023-02-22T07:31:15.145678Z"}}}
+
+        # The legacy bookmark keeps its microseconds when written back as-is.
+        stream.update_bookmark(state, helper.to_epoch_micros("2023-02-22T07:31:15.145678Z"))
+        self.assertEqual(state["bookmarks"]["campaigns"]["updatedAt"], "2023-02-22T07:31:15.145678Z")
+
+        stream.update_bookmark(state, helper.to_epoch_micros(1677051075000))
+        self.assertEqual(state["bookmarks"]["campaigns"]["updatedAt"], "2023-02-22T07:31:15.145678Z")
+
+        stream.update_bookmark(state, helper.to_epoch_micros(1677051076000))
+        self.assertEqual(state["bookmarks"]["campaigns"]["updatedAt"], "2023-02-22T07:31:16.000000Z")
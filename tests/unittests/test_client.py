@@ -0,0 +1,84 @@
+import json
+import threading
+import unittest
+from unittest import mock
+
+from tap_iterable.iterable import Iterable, DEFAULT_CONNECT_TIMEOUT
+
+
+class MockResponse:
+    status_code = 200
+
+    def __init__(self, json_data=None):
+        self.json_data = json_data or {}
+
+    @property
+    def content(self):
+        return json.dumps(self.json_data).encode()
+
+    def json(self):
+        return self.json_data
+
+    def raise_for_status(self):
+        return self.status_code
+
+
+class TestClientSession(unittest.TestCase):
+    """
+    Test the pooled, thread-local sessions of the Iterable client.
+    """
+
+    def test_session_reused_within_thread(self):
+        client = Iterable("api-key")
+        self.assertIs(client.session, client.session)
+
+    def test_session_per_thread_shares_adapter(self):
+        client = Iterable("api-key", pool_size=4)
+        sessions = []
+
+        def worker():
+            sessions.append(client.session)
+
+        threads = [threading.Thread(target=worker) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len({id(session) for session in sessions}), 3)
+        for session in sessions:
+            self.assertIs(session.get_adapter("https://api.iterable.com/api/"), client._adapter)
+        self.assertEqual(client._adapter._pool_maxsize, 4)
+
+    def test_session_headers(self):
+        client = Iterable("api-key", keep_alive="false")
+        self.assertEqual(client.session.headers["api_key"], "api-key")
+        self.assertEqual(client.session.headers["Connection"], "close")
+
+    @mock.patch("requests.Session.get", return_value=MockResponse())
+    def test_get_uses_timeout_and_params(self, mock_get):
+        client = Iterable("api-key", request_timeout="60")
+        client._get("lists/getUsers", listId=1)
+
+        mock_get.assert_called_once_with("https://api.iterable.com/api/lists/getUsers",
+                                         stream=True,
+                                         params={"listId": 1},
+                                         timeout=(DEFAULT_CONNECT_TIMEOUT, 60.0))
+
+    @mock.patch("requests.Session.get", return_value=MockResponse())
+    def test_api_base_url(self, mock_get):
+        client = Iterable("api-key", api_base_url="http://127.0.0.1:8080/api")
+        client._get("lists")
+
+        self.assertEqual(mock_get.call_args[0][0], "http://127.0.0.1:8080/api/lists")
+
+    @mock.patch("requests.Session.get", return_value=MockResponse())
+    def test_export_only_fields(self, mock_get):
+        client = Iterable("api-key", start_date="2023-01-01T00:00:00Z")
+        get_data = next(client.get_data_export_generator("emailSend", "2023-01-01T00:00:00Z",
+                                                       only_fields=["createdAt", "email"]))
+        get_data()
+
+        params = mock_get.call_args[1]["params"]
+        self.assertEqual(params["dataTypeName"], "emailSend")
+        self.assertEqual(params["onlyFields"], ["createdAt", "email"])
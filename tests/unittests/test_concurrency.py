@@ -0,0 +1,109 @@
+import threading
+import time
+import unittest
+
+from tap_iterable.concurrency import ordered_map, interleave
+
+
+class TestOrderedMap(unittest.TestCase):
+    """
+    Test the bounded, order-preserving thread pool map.
+    """
+
+    def test_results_in_input_order(self):
+        def slow_for_small(value):
+            time.sleep(0.01 * (5 - value))
+            return value * 10
+
+        self.assertEqual(list(ordered_map(slow_for_small, range(5), 3)), [0, 10, 20, 30, 40])
+
+    def test_inline_when_single_worker(self):
+        threads = set()
+
+        def record_thread(value):
+            threads.add(threading.get_ident())
+            return value
+
+        self.assertEqual(list(ordered_map(record_thread, [1, 2, 3], 1)), [1, 2, 3])
+        self.assertEqual(threads, {threading.get_ident()})
+
+    def test_in_flight_calls_bounded(self):
+        lock = threading.Lock()
+        in_flight = [0]
+        peak = [0]
+
+        def track(value):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+            return value
+
+        self.assertEqual(list(ordered_map(track, range(20), 4)), list(range(20)))
+        self.assertLessEqual(peak[0], 4)
+
+    def test_items_consumed_lazily(self):
+        pulled = []
+
+        def items():
+            for value in range(10):
+                pulled.append(value)
+                yield value
+
+        results = ordered_map(lambda value: value, items(), 2)
+        self.assertEqual(next(results), 0)
+        self.assertLessEqual(len(pulled), 3)
+        results.close()
+
+    def test_worker_exception_propagates(self):
+        def fail_on_two(value):
+            if value == 2:
+                raise ValueError("boom")
+            return value
+
+        with self.assertRaises(ValueError):
+            list(ordered_map(fail_on_two, range(5), 3))
+
+
+class TestInterleave(unittest.TestCase):
+    """
+    Test the bounded fan-in of several producers.
+    """
+
+    def test_all_items_and_per_producer_order(self):
+        producers = [lambda key=key: ("{}{}".format(key, i) for i in range(50)) for key in "abc"]
+        items = list(interleave(producers, max_workers=3, max_buffered_batches=2, batch_size=7))
+
+        self.assertEqual(len(items), 150)
+        for key in "abc":
+            self.assertEqual([item for item in items if item[0] == key],
+                             ["{}{}".format(key, i) for i in range(50)])
+
+    def test_inline_when_single_worker(self):
+        producers = [lambda: iter([1, 2]), lambda: iter([3])]
+        self.assertEqual(list(interleave(producers, max_workers=1)), [1, 2, 3])
+
+    def test_producer_exception_propagates(self):
+        def failing():
+            yield 1
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            list(interleave([failing, lambda: iter(range(10))], max_workers=2, batch_size=1))
+
+    def test_producers_held_back_by_slow_consumer(self):
+        produced = [0]
+
+        def producer():
+            for i in range(10000):
+                produced[0] += 1
+                yield i
+
+        items = interleave([producer], max_workers=2, max_buffered_batches=1, batch_size=10)
+        next(items)
+        time.sleep(0.05)
+        # One batch consumed, one queued and one being built at most.
+        self.assertLessEqual(produced[0], 40)
+        items.close()
@@ -0,0 +1,240 @@
+import json
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from singer import metadata
+
+from tap_iterable.context import Context
+from tap_iterable.streams import EmailSend, Users
+from tap_iterable.sync import BatchProcessor
+
+
+class MockExportResponse:
+    """ Minimal streaming response for `export/data.json`. """
+
+    def __init__(self, lines, delay=0):
+        self.body = b"\n".join(lines)
+        self.delay = delay
+
+    def iter_content(self, chunk_size=1):
+        time.sleep(self.delay)
+        # Small chunks so records are split across chunk boundaries.
+        for i in range(0, len(self.body), 7):
+            yield self.body[i:i + 7]
+
+    def close(self):
+        pass
+
+
+def export_window(created_at, count, delay=0):
+    return export_window_of([created_at] * count, delay)
+
+
+def export_window_of(created_ats, delay=0, end_date=None):
+    # A created_at of None leaves the record without `createdAt`.
+    lines = [json.dumps(dict({"email": "user{}@example.com".format(i)},
+                             **({"createdAt": created_at} if created_at is not None else {}))).encode()
+             for i, created_at in enumerate(created_ats)]
+    end_date = end_date or max(created_at for created_at in created_ats if created_at is not None)
+    return lambda: (MockExportResponse(lines, delay), end_date)
+
+
+class TestSyncDataExport(unittest.TestCase):
+    """
+    Test the data export sync of `EmailSend` with mocked export windows.
+    """
+
+    def setUp(self):
+        self.config = Context.config
+        Context.config = {"start_date": "2023-01-01T00:00:00Z"}
+
+    def tearDown(self):
+        Context.config = self.config
+
+    def _sync(self, windows):
+        client = MagicMock()
+        client.get_data_export_generator.return_value = iter(windows)
+        stream = EmailSend(client=client)
+        stream.stream = MagicMock()
+        state = {}
+        with patch("singer.write_state") as mock_write_state:
+            records = [rec for _, rec in stream.sync(state)]
+        return records, state, mock_write_state
+
+    def test_windows_emitted_in_order_when_concurrent(self):
+        Context.config["export_window_concurrency"] = 3
+        windows = [
+            export_window("2023-01-01 00:00:00 +00:00", 2, delay=0.05),
+            export_window("2023-01-02 00:00:00 +00:00", 3, delay=0.01),
+            export_window("2023-01-03 00:00:00 +00:00", 1),
+        ]
+
+        records, state, mock_write_state = self._sync(windows)
+
+        self.assertEqual([rec["createdAt"][:10] for rec in records],
+                         ["2023-01-01"] * 2 + ["2023-01-02"] * 3 + ["2023-01-03"])
+        self.assertEqual(mock_write_state.call_count, 3)
+        self.assertEqual(state["bookmarks"]["email_send"]["createdAt"], "2023-01-03T00:00:00.000000Z")
+
+    def test_sequential_windows(self):
+        windows = [
+            export_window("2023-01-01 00:00:00 +00:00", 2),
+            export_window("2023-01-02 00:00:00 +00:00", 2),
+        ]
+
+        records, state, _ = self._sync(windows)
+
+        self.assertEqual(len(records), 4)
+        self.assertEqual(state["bookmarks"]["email_send"]["createdAt"], "2023-01-02T00:00:00.000000Z")
+        self.assertNotIn("window_in_days", state["bookmarks"]["email_send"])
+
+    def test_adaptive_window_persisted_in_state(self):
+        Context.config.update({"adaptive_export_window": "true", "target_window_records": 2})
+        windows = [
+            export_window("2023-01-01 00:00:00 +00:00", 4),
+        ]
+        client_window_in_days = 10
+
+        client = MagicMock()
+        client.api_window_in_days = client_window_in_days
+
+        def generator(data_type_name, bookmark, planner, only_fields=None):
+            planner.plan(client_window_in_days)
+            return iter(windows)
+
+        client.get_data_export_generator.side_effect = generator
+        stream = EmailSend(client=client)
+        stream.stream = MagicMock()
+        state = {}
+        with patch("singer.write_state"):
+            list(stream.sync(state))
+
+        # 4 records against a target of 2 halves the window.
+        self.assertEqual(state["bookmarks"]["email_send"]["window_in_days"], 5)
+
+
+class TestIntraWindowCheckpoints(unittest.TestCase):
+    """
+    Test checkpoints written in the middle of a data export window.
+    """
+
+    def setUp(self):
+        self.config = Context.config
+        Context.config = {"start_date": "2023-01-01T00:00:00Z", "checkpoint_every_records": 2}
+
+    def tearDown(self):
+        Context.config = self.config
+
+    def _bookmarks_written(self, created_ats, end_date=None, batched=False):
+        client = MagicMock()
+        client.get_data_export_generator.return_value = iter([export_window_of(created_ats, end_date=end_date)])
+        stream = EmailSend(client=client)
+        stream.stream = MagicMock()
+        if batched:
+            # Batches of about one line each, so checkpoints fall as in the inline path.
+            Context.config["export_batch_size_kb"] = 0.01
+            schema = stream.load_schema()
+            processor = BatchProcessor(("email_send", schema, {}, (), True), None, "createdAt", True)
+            stream.batch_processor = lambda batches: map(processor, batches)
+        state = {}
+        bookmarks = []
+        with patch("tap_iterable.writer.write_state",
+                   side_effect=lambda s: bookmarks.append(s["bookmarks"]["email_send"]["createdAt"])):
+            for _ in stream.sync(state):
+                pass
+        return bookmarks
+
+    def test_checkpoints_follow_emitted_records(self):
+        bookmarks = self._bookmarks_written(["2023-01-01 00:00:0{} +00:00".format(i) for i in range(5)])
+
+        self.assertEqual(bookmarks, [
+            "2023-01-01T00:00:01.000000Z",
+            "2023-01-01T00:00:03.000000Z",
+            "2023-01-01T00:00:04.000000Z",
+        ])
+
+    def test_no_checkpoints_once_out_of_order(self):
+        bookmarks = self._bookmarks_written(["2023-01-01 00:00:0{} +00:00".format(i) for i in [0, 1, 3, 2, 4, 5]])
+
+        # One checkpoint before the disorder was seen, then back to the start
+        # of the window, as records older than that checkpoint may follow,
+        # and only the end of the window after that.
+        self.assertEqual(bookmarks, [
+            "2023-01-01T00:00:01.000000Z",
+            "2023-01-01T00:00:00.000000Z",
+            "2023-01-01T00:00:05.000000Z",
+        ])
+
+    def test_checkpoints_held_back_by_lag(self):
+        Context.config["checkpoint_lag_seconds"] = 2
+        bookmarks = self._bookmarks_written(["2023-01-01 00:00:0{} +00:00".format(i) for i in range(5)])
+
+        # Never before the start of the window (the start date here).
+        self.assertEqual(bookmarks, [
+            "2023-01-01T00:00:00.000000Z",
+            "2023-01-01T00:00:01.000000Z",
+            "2023-01-01T00:00:04.000000Z",
+        ])
+
+    def test_records_without_replication_key_not_checkpointed(self):
+        created_ats = ["2023-01-01 00:00:00 +00:00", None, "2023-01-01 00:00:02 +00:00", "2023-01-01 00:00:03 +00:00"]
+        for batched in (False, True):
+            bookmarks = self._bookmarks_written(created_ats, end_date="2023-01-31 00:00:00 +00:00", batched=batched)
+
+            # Only the end of the window moves the bookmark to the window end.
+            self.assertEqual(bookmarks, ["2023-01-01T00:00:02.000000Z", "2023-01-31T00:00:00.000000Z"], batched)
+
+
+class TestFieldProjection(unittest.TestCase):
+    """
+    Test pushing the catalog's field selection down into the export request.
+    """
+
+    def setUp(self):
+        self.config = Context.config
+        Context.config = {"start_date": "2023-01-01T00:00:00Z"}
+
+    def tearDown(self):
+        Context.config = self.config
+
+    def _stream(self, stream_cls, selected):
+        stream = stream_cls(client=MagicMock())
+        schema = stream.load_schema()
+        mdata = metadata.to_map(stream.load_metadata(schema))
+        for breadcrumb in mdata:
+            if breadcrumb:
+                mdata = metadata.write(mdata, breadcrumb, "selected", breadcrumb[1] in selected)
+        stream.stream = MagicMock()
+        stream.stream.schema.to_dict.return_value = schema
+        stream.stream.metadata = metadata.to_list(mdata)
+        return stream
+
+    def test_selected_and_automatic_fields_requested(self):
+        stream = self._stream(EmailSend, ["campaignId", "email"])
+        line = json.dumps({"createdAt": "2023-01-01 00:00:00 +00:00", "email": "a@example.com",
+                           "campaignId": 1, "templateId": 2, "transactionalData": "{not json"}).encode()
+        stream.client.get_data_export_generator.return_value = iter(
+            [lambda: (MockExportResponse([line]), "2023-01-01 00:00:00")])
+
+        with patch("singer.write_state"):
+            records = [rec for _, rec in stream.sync({})]
+
+        stream.client.get_data_export_generator.assert_called_once_with(
+            "emailSend", "2023-01-01T00:00:00Z", None, ["campaignId", "createdAt", "email"])
+        # Unselected fields are dropped before `transactionalData` would be decoded.
+        self.assertEqual(records, [{"createdAt": "2023-01-01 00:00:00 +00:00",
+                                    "email": "a@example.com", "campaignId": 1}])
+
+    def test_renamed_and_dotted_fields_use_api_names(self):
+        stream = self._stream(Users, ["_industry", "offers.url"])
+        self.assertEqual(stream.get_projected_fields(), {"Industry", "offers.url", "email", "profileUpdatedAt"})
+
+    def test_no_projection_when_everything_selected(self):
+        stream = EmailSend(client=MagicMock())
+        schema = stream.load_schema()
+        self.assertIsNone(self._stream(EmailSend, list(schema["properties"])).get_projected_fields())
+
+    def test_projection_can_be_disabled(self):
+        Context.config["export_field_projection"] = "false"
+        self.assertIsNone(self._stream(EmailSend, ["email"]).get_projected_fields())
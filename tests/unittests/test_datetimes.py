@@ -0,0 +1,75 @@
+import datetime
+import random
+import unittest
+
+import pytz
+from singer import Transformer, utils
+
+import tap_iterable.datetimes as datetimes
+import tap_iterable.helper as helper
+
+
+def original_epoch_to_datetime_string(milliseconds):
+    return datetime.datetime.fromtimestamp(milliseconds / 1000.0, pytz.timezone("UTC")).strftime(
+        '%Y-%m-%d %H:%M:%S.%f')
+
+
+MILLIS = [0, 1, 999, 1000, 1677051075145, 1677051075999, datetimes.MAX_EXACT_MILLIS - 1] + \
+    [random.Random(0).randrange(datetimes.MAX_EXACT_MILLIS) for _ in range(2000)]
+
+OTHER_VALUES = [
+    "2023-01-02 03:04:05 +00:00", "2023-01-02T03:04:05.123456Z", "2024-02-29 23:59:59 +00:00",
+    "2023-02-29 00:00:00 +00:00", "0999-01-01 00:00:00 +00:00", "2023-01-02 03:04:05 +01:00",
+    "2023-01-02", "2023-03-01T10:00:00Z", "1677051075145", "not a date", "", None,
+    True, -1, -1677051075145, datetimes.MAX_EXACT_MILLIS, 1677051075145.5, 1677051075.0,
+]
+
+
+class TestDatetimeConverter(unittest.TestCase):
+    """
+    Test that the converter and formatters give the same strings as singer
+    and the original helper.
+    """
+
+    def test_same_as_transformer(self):
+        transformer = Transformer(integer_datetime_fmt="unix-milliseconds-integer-datetime-parsing")
+        convert = datetimes.DatetimeConverter(transformer)
+        for value in MILLIS + OTHER_VALUES:
+            expected = transformer._transform_datetime(value)
+            # Twice, to compare memoized results as well.
+            self.assertEqual(convert(value), expected, value)
+            self.assertEqual(convert(value), expected, value)
+
+    def test_primed_same_as_transformer(self):
+        transformer = Transformer(integer_datetime_fmt="unix-milliseconds-integer-datetime-parsing")
+        convert = datetimes.DatetimeConverter(transformer)
+        convert.prime(MILLIS + OTHER_VALUES)
+        for value in MILLIS:
+            self.assertEqual(convert(value), transformer._transform_datetime(value))
+
+    def test_batch_same_as_one_at_a_time(self):
+        self.assertEqual(datetimes.format_millis_batch(MILLIS), [datetimes.format_millis(value) for value in MILLIS])
+
+    @unittest.skipIf(datetimes.numpy is None, "NumPy is not installed")
+    def test_vectorized_same_as_singer(self):
+        transformer = Transformer(integer_datetime_fmt="unix-milliseconds-integer-datetime-parsing")
+        self.assertEqual(datetimes.format_millis_batch(MILLIS),
+                         [transformer._transform_datetime(value) for value in MILLIS])
+
+    def test_other_integer_formats_use_transformer(self):
+        transformer = Transformer(integer_datetime_fmt="unix-seconds-integer-datetime-parsing")
+        convert = datetimes.DatetimeConverter(transformer)
+        for value in [1677051075, "2023-01-02 03:04:05 +00:00"]:
+            self.assertEqual(convert(value), transformer._transform_datetime(value))
+
+    def test_epoch_to_datetime_string(self):
+        for value in MILLIS + [1677051075145.5, -1677051075145, datetimes.MAX_EXACT_MILLIS]:
+            self.assertEqual(helper.epoch_to_datetime_string(value), original_epoch_to_datetime_string(value))
+        self.assertEqual(helper.epoch_to_datetime_string("2023-01-02 03:04:05"), "2023-01-02 03:04:05")
+
+    def test_export_datetime_to_epoch_micros(self):
+        for value in ["2023-01-02 03:04:05 +00:00", "2023-01-02T03:04:05.123456Z", "1970-01-01 00:00:00 +00:00"]:
+            delta = utils.strptime_to_utc(value) - helper.EPOCH
+            self.assertEqual(datetimes.export_datetime_to_epoch_micros(value), delta // datetime.timedelta(microseconds=1))
+        for value in ["2023-02-29 00:00:00 +00:00", "2023-01-02 03:04:05 +01:00", "2023-01-02"]:
+            self.assertIsNone(datetimes.export_datetime_to_epoch_micros(value))
@@ -1,8 +1,10 @@
+import threading
 import unittest
 from unittest.mock import MagicMock, patch
 
 import requests
 
+from tap_iterable.context import Context
 from tap_iterable.discover import (
     _apply_access_checks,
     _prune_inaccessible_children,
@@ -238,6 +240,26 @@ class TestApplyAccessChecks(unittest.TestCase):
                 _apply_access_checks(client, accessible)
         self.assertEqual(expected_message, str(ctx.exception))
 
+    def test_probes_run_concurrently(self):
+        """Access probes overlap, and pruning is the same as when run in series."""
+        client = MagicMock()
+        accessible = list(STREAMS.keys())
+        parents = [name for name, cls in STREAMS.items() if not getattr(cls, "parent", None)]
+        barrier = threading.Barrier(2, timeout=5)
+
+        def fake_check_access(self):
+            if self.name in parents[:2]:
+                # Both probes must be in flight at once to pass the barrier.
+                barrier.wait()
+            return self.name != "lists"
+
+        with patch.object(Context, "config", {"discovery_concurrency": 4}), \
+             patch("tap_iterable.streams.Stream.check_access", fake_check_access):
+            _apply_access_checks(client, accessible)
+
+        expected = [name for name in STREAMS if name not in ("lists", "list_users")]
+        self.assertEqual(expected, accessible)
+
 
 class TestDiscoverStreams(unittest.TestCase):
     """Integration-style unit tests for discover_streams()."""
@@ -0,0 +1,72 @@
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import tap_iterable
+from tap_iterable.discovery_cache import DiscoveryCache
+
+
+CATALOG = {"streams": [{"stream": "lists", "tap_stream_id": "lists", "schema": {}, "metadata": []}]}
+
+
+class TestDiscoveryCache(unittest.TestCase):
+    """
+    Test the on-disk discovery cache and its use by `discover`.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.config = {"api_key": "secret", "discovery_cache_dir": self.tmp.name}
+
+    def test_round_trip_within_ttl(self):
+        cache = DiscoveryCache(self.tmp.name, "secret", ttl=60, version="1.0.0")
+        self.assertIsNone(cache.load())
+        cache.store(CATALOG)
+        self.assertEqual(DiscoveryCache(self.tmp.name, "secret", ttl=60, version="1.0.0").load(), CATALOG)
+        # The API key itself is never written to disk.
+        for name in os.listdir(self.tmp.name):
+            with open(os.path.join(self.tmp.name, name)) as f:
+                self.assertNotIn("secret", name + f.read())
+
+    def test_keyed_by_api_key_base_url_and_version(self):
+        DiscoveryCache(self.tmp.name, "secret", version="1.0.0").store(CATALOG)
+        self.assertIsNone(DiscoveryCache(self.tmp.name, "other", version="1.0.0").load())
+        self.assertIsNone(DiscoveryCache(self.tmp.name, "secret", version="1.0.1").load())
+        self.assertIsNone(DiscoveryCache(self.tmp.name, "secret", version="1.0.0",
+                                         api_base_url="https://api.eu.iterable.com/api/").load())
+        # The default URL, however written, shares the entry.
+        self.assertEqual(DiscoveryCache(self.tmp.name, "secret", version="1.0.0",
+                                        api_base_url="https://api.iterable.com/api").load(), CATALOG)
+
+    def test_expired_entry_ignored(self):
+        cache = DiscoveryCache(self.tmp.name, "secret", ttl=60, version="1.0.0")
+        cache.store(CATALOG)
+        with mock.patch("tap_iterable.discovery_cache.time.time", return_value=time.time() + 61):
+            self.assertIsNone(cache.load())
+
+    def test_corrupt_entry_ignored(self):
+        cache = DiscoveryCache(self.tmp.name, "secret", version="1.0.0")
+        with open(cache.path, "w") as f:
+            f.write("{")
+        self.assertIsNone(cache.load())
+
+    @mock.patch("tap_iterable.discover_streams", return_value=CATALOG["streams"])
+    def test_cached_discovery_makes_no_api_calls(self, mocked_discover_streams):
+        client = mock.MagicMock()
+        for _ in range(2):
+            with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+                tap_iterable.discover(client, self.config)
+            self.assertEqual(json.loads(stdout.getvalue()), CATALOG)
+        self.assertEqual(client.check_api_credentials.call_count, 1)
+        self.assertEqual(mocked_discover_streams.call_count, 1)
+
+        # A forced refresh discovers again and replaces the entry.
+        with mock.patch("sys.stdout", new_callable=io.StringIO):
+            tap_iterable.discover(client, dict(self.config, discovery_cache_refresh="true"))
+        self.assertEqual(client.check_api_credentials.call_count, 2)
+        self.assertEqual(mocked_discover_streams.call_count, 2)
@@ -55,7 +55,7 @@ class TestGenericServer5xxError(unittest.TestCase):
         [511, "Network Authentication Required"],
     ])
     @mock.patch("time.sleep")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_generic_5xx_errors_with_backoff(self, mock_error_code, error_description, mock_get, mock_sleep):
         """
         Test that generic 5xx errors (not in ERROR_CODE_EXCEPTION_MAPPING) raise IterableServer5xxError
@@ -79,7 +79,7 @@ class TestGenericServer5xxError(unittest.TestCase):
         [505, {"message": "Custom 5xx Error Message"}],
     ])
     @mock.patch("time.sleep")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_generic_5xx_errors_with_custom_message(self, mock_error_code, json_response, mock_get, mock_sleep):
         """
         Test that generic 5xx errors include custom error messages from the API response.
@@ -95,7 +95,7 @@ class TestGenericServer5xxError(unittest.TestCase):
         self.assertEqual(str(e.exception), expected_message)
 
     @mock.patch("time.sleep")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_504_error_specifically(self, mock_get, mock_sleep):
         """
         Test specifically for 504 error code as mentioned in the code comments.
@@ -114,7 +114,7 @@ class TestGenericServer5xxError(unittest.TestCase):
         self.assertEqual(mock_get.call_count, 7)
 
     @mock.patch("time.sleep")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_generic_5xx_not_503(self, mock_get, mock_sleep):
         """
         Test that generic 5xx errors (e.g., 502, 505) are different from 503
@@ -130,7 +130,7 @@ class TestGenericServer5xxError(unittest.TestCase):
         self.assertEqual(type(e.exception).__name__, 'IterableServer5xxError')
 
     @mock.patch("time.sleep")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_generic_5xx_error_with_invalid_json_response(self, mock_get, mock_sleep):
         """
         Test that generic 5xx errors handle invalid JSON responses gracefully.
@@ -152,7 +152,7 @@ class TestGenericServer5xxError(unittest.TestCase):
         self.assertEqual(mock_get.call_count, 7)
 
     @mock.patch("time.sleep")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_multiple_5xx_errors_eventually_succeed(self, mock_get, mock_sleep):
         """
         Test that after multiple 5xx errors, a successful response is eventually returned.
@@ -0,0 +1,214 @@
+import gzip
+import io
+import mmap
+import threading
+import unittest
+from unittest import mock
+
+import requests
+import urllib3
+
+from tap_iterable.pipeline import SpillBuffer, ExportWindow, MappedRegion, pipelined_export_windows, \
+    get_spill_codec
+import tap_iterable.helper as helper
+
+
+class MockResponse:
+
+    def __init__(self, chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+        self.closed = False
+
+    def iter_content(self, chunk_size=1):
+        for chunk in self.chunks:
+            yield chunk
+        if self.error:
+            raise self.error
+
+    def close(self):
+        self.closed = True
+
+
+def drain(buffer):
+    chunks = []
+    while True:
+        chunk = buffer.get()
+        if chunk is None:
+            return chunks
+        if isinstance(chunk, MappedRegion):
+            chunk = chunk.mmap[chunk.start:chunk.end]
+        chunks.append(chunk)
+
+
+def drain_one(buffer):
+    chunk = buffer.get()
+    if isinstance(chunk, MappedRegion):
+        chunk = chunk.mmap[chunk.start:chunk.end]
+    return chunk
+
+
+class TestSpillBuffer(unittest.TestCase):
+    """
+    Test the bounded in-memory buffer that overflows to disk.
+    """
+
+    def test_in_memory_when_consumer_keeps_up(self):
+        buffer = SpillBuffer(max_memory_bytes=10)
+        buffer.put(b"abc")
+        self.assertEqual(buffer.get(), b"abc")
+        buffer.put(b"def")
+        buffer.finish()
+        self.assertEqual(drain(buffer), [b"def"])
+        self.assertEqual(buffer.bytes_spilled, 0)
+
+    def test_spills_when_full_and_preserves_order(self):
+        buffer = SpillBuffer(max_memory_bytes=4)
+        for chunk in [b"ab", b"cd", b"ef", b"gh"]:
+            buffer.put(chunk)
+        self.assertEqual(buffer.bytes_spilled, 4)
+        self.assertEqual(buffer.get(), b"ab")
+        # Still spilling until the spill file has been drained.
+        buffer.put(b"ij")
+        buffer.finish()
+        self.assertEqual(b"".join(drain(buffer)), b"cdefghij")
+
+    def test_returns_to_memory_after_spill_drained(self):
+        buffer = SpillBuffer(max_memory_bytes=2)
+        buffer.put(b"ab")
+        buffer.put(b"cd")
+        self.assertEqual(drain_one(buffer), b"ab")
+        self.assertEqual(drain_one(buffer), b"cd")
+        buffer.put(b"ef")
+        # Only "cd" went to disk.
+        self.assertEqual(buffer.bytes_spilled, 2)
+        buffer.finish()
+        self.assertEqual(drain(buffer), [b"ef"])
+
+    def test_producer_error_raised_to_consumer(self):
+        buffer = SpillBuffer(max_memory_bytes=10)
+        buffer.put(b"ab")
+        buffer.finish(ValueError("connection reset"))
+        self.assertEqual(buffer.get(), b"ab")
+        with self.assertRaises(ValueError):
+            buffer.get()
+
+    def test_consumer_waits_for_producer(self):
+        buffer = SpillBuffer(max_memory_bytes=10)
+
+        def produce():
+            buffer.put(b"ab")
+            buffer.finish()
+
+        thread = threading.Thread(target=produce)
+        thread.start()
+        self.assertEqual(drain(buffer), [b"ab"])
+        thread.join()
+
+
+class TestExportWindow(unittest.TestCase):
+    """
+    Test line splitting and ordering of pipelined export windows.
+    """
+
+    def test_lines_split_across_chunks(self):
+        response = MockResponse([b'{"a": 1}\n{"a"', b': 2}\n\n{"a": 3}'])
+        window = ExportWindow(lambda: (response, "2023-01-01 00:00:00"), max_memory_bytes=4)
+        window.download()
+        self.assertEqual(list(window.iter_lines()), [b'{"a": 1}', b'{"a": 2}', b'{"a": 3}'])
+        self.assertEqual(window.request_end_date, "2023-01-01 00:00:00")
+        self.assertTrue(response.closed)
+
+    def test_download_error_surfaces_in_iter_lines(self):
+        response = MockResponse([b'{"a": 1}\n'], error=IOError("truncated"))
+        window = ExportWindow(lambda: (response, None), max_memory_bytes=1024)
+        window.download()
+        with self.assertRaises(IOError):
+            list(window.iter_lines())
+
+    def test_lines_parsed_from_mapped_spill_file(self):
+        body = b'{"a": 1}\n{"a": 2}\r\n{"a": 3}\n{"a": 4}'
+        response = MockResponse([body[i:i + 5] for i in range(0, len(body), 5)])
+        window = ExportWindow(lambda: (response, None), max_memory_bytes=5)
+        window.download()
+        self.assertGreater(window.buffer.bytes_spilled, 0)
+
+        records = [helper.loads(line) for line in window.iter_lines()]
+        self.assertEqual(records, [{"a": 1}, {"a": 2}, {"a": 3}, {"a": 4}])
+
+    def test_batches_of_spilled_window_stay_bounded(self):
+        lines = [b'{"a": %d}' % i for i in range(20000)]
+        body = b"\n".join(lines)
+        response = MockResponse([body[i:i + 4096] for i in range(0, len(body), 4096)])
+        window = ExportWindow(lambda: (response, None), max_memory_bytes=4096)
+        window.download()
+        self.assertGreater(window.buffer.bytes_spilled, 64 * 1024)
+
+        batches = list(window.iter_batches(1024))
+        self.assertLessEqual(max(len(batch) for batch in batches), 2 * 1024)
+        self.assertTrue(all(batch.endswith(b"\n") for batch in batches[:-1]))
+        self.assertEqual(b"".join(batches), body)
+
+    def test_spilled_lines_are_views_of_the_mapped_file(self):
+        buffer = SpillBuffer(max_memory_bytes=1)
+        window = ExportWindow(None, max_memory_bytes=1)
+        window.buffer = buffer
+        buffer.put(b'{"a": 1}\n')
+        buffer.put(b'{"a": 2}\n{"a": 3}\n')
+        buffer.finish()
+
+        lines = list(window.iter_lines())
+        self.assertEqual(lines, [b'{"a": 1}', b'{"a": 2}', b'{"a": 3}'])
+        self.assertIsInstance(lines[1], memoryview)
+        self.assertIsInstance(lines[1].obj, mmap.mmap)
+
+    def test_loads_falls_back_to_stdlib(self):
+        self.assertEqual(helper.loads(memoryview(b'{"a": 18446744073709551616}')), {"a": 2 ** 64})
+        self.assertEqual(helper.loads(b'{"a": "caf\\u00e9"}'), {"a": "caf\u00e9"})
+        with self.assertRaises(ValueError):
+            helper.loads(memoryview(b'{"a": '))
+        with mock.patch.object(helper, "orjson", None):
+            self.assertEqual(helper.loads(memoryview(b'{"a": [1.5]}')), {"a": [1.5]})
+
+    def test_windows_yielded_in_order(self):
+        fns = [(lambda i=i: (MockResponse([str(i).encode() * 3]), str(i))) for i in range(5)]
+        lines = []
+        for window in pipelined_export_windows(fns, concurrency=3, max_memory_bytes=1):
+            lines.extend(window.iter_lines())
+        self.assertEqual(lines, [b"000", b"111", b"222", b"333", b"444"])
+
+
+class TestCompression(unittest.TestCase):
+    """
+    Test gzip-encoded transfer and compressed spill files.
+    """
+
+    def test_compressed_spill_preserves_order(self):
+        buffer = SpillBuffer(max_memory_bytes=4, codec=get_spill_codec("gzip"))
+        chunks = [b"ab", b"cd", b"x" * 1000, b"ef"]
+        for chunk in chunks:
+            buffer.put(chunk)
+        buffer.finish()
+
+        self.assertEqual(b"".join(drain(buffer)), b"".join(chunks))
+        self.assertEqual(buffer.bytes_spilled, 1002)
+        self.assertLess(buffer.bytes_spilled_on_disk, buffer.bytes_spilled)
+
+    def test_unknown_codec(self):
+        self.assertIsNone(get_spill_codec(None))
+        self.assertIsNone(get_spill_codec("none"))
+        with self.assertRaises(ValueError):
+            get_spill_codec("snappy")
+
+    def test_gzip_transfer_decoded_as_stream(self):
+        body = b"\n".join(b'{"id": %d}' % i for i in range(1000))
+        compressed = gzip.compress(body)
+        response = requests.Response()
+        response.raw = urllib3.HTTPResponse(body=io.BytesIO(compressed), headers={"Content-Encoding": "gzip"},
+                                            preload_content=False)
+        window = ExportWindow(lambda: (response, None), max_memory_bytes=1024, spill_codec=get_spill_codec("gzip"))
+        window.download()
+
+        self.assertEqual(list(window.iter_lines()), body.split(b"\n"))
+        self.assertEqual(window.bytes_received, len(body))
+        self.assertEqual(window.bytes_transferred, len(compressed))
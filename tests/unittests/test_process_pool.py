@@ -0,0 +1,86 @@
+import io
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+from tap_iterable.context import Context
+from tap_iterable.process_pool import ProcessPool, WorkerError
+from tap_iterable.streams import STREAMS
+from tap_iterable.sync import BatchProcessor, sync_stream
+import tap_iterable.writer as writer
+
+from test_data_export import MockExportResponse
+from test_sync import build_catalog
+
+
+def users_record(day, i):
+    record = {"email": "user{}@example.com".format(i),
+              "profileUpdatedAt": "2023-01-{:02d} 00:00:{:02d} +00:00".format(day, i),
+              "devices": [{"os": "ios"}]}
+    if i % 2:
+        # Renamed, coerced and unknown fields, which the transform changes.
+        record.update({"Industry": "retail", "itemCount": str(i), "extra": i})
+    return record
+
+
+def users_window(day, count):
+    lines = [json.dumps(users_record(day, i)).encode() for i in range(count)]
+    return lambda: (MockExportResponse(lines), "2023-01-{:02d} 00:01:00 +00:00".format(day))
+
+
+class TestExportProcessPool(unittest.TestCase):
+    """
+    Test parsing, transforming and encoding data export records on worker processes.
+    """
+
+    def setUp(self):
+        self.config = Context.config
+        Context.config = {"start_date": "2023-01-01T00:00:00Z", "export_batch_size_kb": 0.2}
+        self.addCleanup(setattr, Context, "config", self.config)
+        self.addCleanup(writer.configure)
+
+    def _sync_users(self, windows):
+        catalog_entry = build_catalog(["users"]).streams[0]
+        client = MagicMock()
+        client.get_data_export_generator.return_value = iter(windows)
+        instance = STREAMS["users"](client)
+        instance.stream = catalog_entry
+        state = {}
+        with patch("sys.stdout", io.StringIO()) as output:
+            writer.configure(0)
+            count = sync_stream(state, instance)
+            writer.flush()
+        records = [line for line in output.getvalue().splitlines() if '"RECORD"' in line]
+        return count, records, state
+
+    def test_same_output_as_inline_sync(self):
+        windows = [users_window(2, 10), users_window(3, 0), users_window(4, 25)]
+        expected = self._sync_users(windows)
+        self.assertEqual(expected[0], 35)
+
+        Context.config["export_processes"] = 2
+        self.assertEqual(self._sync_users(windows), expected)
+
+    def test_raw_passthrough_same_output(self):
+        windows = [users_window(2, 10), users_window(4, 25)]
+        expected = self._sync_users(windows)
+
+        Context.config["raw_passthrough"] = "true"
+        count, records, state = self._sync_users(windows)
+        self.assertEqual((count, state), expected[::2])
+        self.assertEqual([json.loads(record) for record in records], [json.loads(record) for record in expected[1]])
+
+        Context.config["export_processes"] = 2
+        count, records, state = self._sync_users(windows)
+        self.assertEqual([json.loads(record) for record in records], [json.loads(record) for record in expected[1]])
+
+    def test_worker_errors_are_raised(self):
+        catalog_entry = build_catalog(["email_send"]).streams[0]
+        schema = catalog_entry.schema.to_dict()
+        prepared_args = ("email_send", schema, {}, (), True)
+        lines = b'{"createdAt": "2023-01-02 00:00:00 +00:00"}\n{"createdAt": "2023-01-02 00:00:00 +00:00", "campaignId": "x"}\n'
+
+        with ProcessPool(1, BatchProcessor, (prepared_args, None, "createdAt", True)) as pool:
+            with self.assertRaises(WorkerError) as error:
+                list(pool.map([lines]))
+        self.assertIn("SchemaMismatch", str(error.exception))
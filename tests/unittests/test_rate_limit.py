@@ -0,0 +1,88 @@
+import unittest
+from unittest import mock
+
+from tap_iterable.rate_limit import TokenBucket, RateLimiter, parse_retry_after, retry_after_expo
+from tap_iterable.exceptions import IterableRateLimitError
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+
+
+class TestTokenBucket(unittest.TestCase):
+    """
+    Test request pacing of the token bucket.
+    """
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.multiple("tap_iterable.rate_limit.time",
+                                      monotonic=self.clock.monotonic, sleep=self.clock.sleep)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_paced(self):
+        bucket = TokenBucket(rate=2, capacity=2)
+        self.assertEqual(bucket.acquire(), 0)
+        self.assertEqual(bucket.acquire(), 0)
+        self.assertEqual(bucket.acquire(), 0.5)
+        self.assertEqual(bucket.acquire(), 1.0)
+        self.assertEqual(self.clock.sleeps, [0.5, 1.0])
+
+    def test_tokens_refill_over_time(self):
+        bucket = TokenBucket(rate=1, capacity=1)
+        bucket.acquire()
+        self.clock.now += 1
+        self.assertEqual(bucket.acquire(), 0)
+
+    def test_unpaced_bucket_can_be_paused(self):
+        bucket = TokenBucket()
+        for _ in range(100):
+            self.assertEqual(bucket.acquire(), 0)
+        bucket.pause(30)
+        self.assertEqual(bucket.acquire(), 30)
+
+    def test_limiter_families(self):
+        limiter = RateLimiter({"export": 4, "lists/getUsers": 5, "lists": 60})
+        self.assertEqual(limiter.family("export/data.json"), "export")
+        self.assertEqual(limiter.family("lists/getUsers"), "lists/getUsers")
+        self.assertEqual(limiter.family("lists"), "lists")
+        self.assertEqual(limiter.family("metadata/table/key"), "metadata")
+
+    def test_limiter_paces_per_minute_and_pauses_family(self):
+        limiter = RateLimiter({"export": 4})
+        self.assertEqual(limiter.acquire("export/data.json"), 0)
+        self.assertEqual(limiter.acquire("export/data.json"), 15)
+        self.assertEqual(limiter.acquire("channels"), 0)
+        limiter.throttled("channels", 7)
+        self.assertEqual(limiter.acquire("channels"), 7)
+
+
+class TestRetryAfter(unittest.TestCase):
+    """
+    Test parsing and honoring of the `Retry-After` header.
+    """
+
+    def test_parse_seconds(self):
+        self.assertEqual(parse_retry_after("12"), 12)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+
+    def test_parse_http_date_in_past(self):
+        self.assertEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0)
+
+    def test_wait_generator(self):
+        wait = retry_after_expo(base=2, factor=2)
+        wait.send(None)
+        self.assertEqual(wait.send(IterableRateLimitError("429")), 2)
+        self.assertEqual(wait.send(IterableRateLimitError("429", retry_after=5)), 5)
+        self.assertEqual(wait.send(IterableRateLimitError("429")), 4)
@@ -1,7 +1,13 @@
+import json
+import time
 import unittest
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 
+import requests
+
+from tap_iterable.context import Context
 from tap_iterable.iterable import Iterable
+from tap_iterable import telemetry
 
 mock_response_templates_data = {'templates': [
     {'templateId': 8381104, 'createdAt': 1677051074457, 'updatedAt': 1677051075145, 'name': 'stitch_template_6',
@@ -21,6 +27,10 @@ class MockResponse:
     def __init__(self, json_data):
         self.json_data = json_data
 
+    @property
+    def content(self):
+        return json.dumps(self.json_data).encode()
+
     def json(self):
         return self.json_data
 
@@ -31,7 +41,7 @@ class MockResponse:
 class TestIterable(unittest.TestCase):
     client_obj = Iterable("mock_api_key")
 
-    @patch('tap_iterable.iterable.requests.get', return_value=MockResponse(mock_response_templates_data))
+    @patch('tap_iterable.iterable.requests.Session.get', return_value=MockResponse(mock_response_templates_data))
     def test_templates(self, mocked_gen_request):
         """
         Test the templates stream flow
@@ -46,7 +56,7 @@ class TestIterable(unittest.TestCase):
         for value in self.client_obj.templates("updatedAt", "2023-02-22T07:31:15.000000Z"):
             self.assertEqual(expected_value, value)
 
-    @patch('tap_iterable.iterable.requests.get', return_value=MockResponse(mock_response_campaigns_data))
+    @patch('tap_iterable.iterable.requests.Session.get', return_value=MockResponse(mock_response_campaigns_data))
     def test_campaigns(self, mocked_gen_request):
         """
         Test the campaigns stream flow
@@ -63,3 +73,132 @@ class TestIterable(unittest.TestCase):
         # Act and Assert
         for value in self.client_obj.campaigns("updatedAt", "2023-03-02 10:18:55+00:00"):
             self.assertEqual(expected_value, value)
+
+
+class MockListUsersResponse:
+
+    def __init__(self, body):
+        self.body = body
+        self.closed = False
+        # Set by `Iterable._get`.
+        self.telemetry_endpoint = "lists/getUsers"
+
+    def iter_lines(self, chunk_size=512):
+        for line in self.body.splitlines():
+            yield line
+
+    def close(self):
+        self.closed = True
+
+
+class TestListUsers(unittest.TestCase):
+
+    def setUp(self):
+        self.config = Context.config
+
+    def tearDown(self):
+        Context.config = self.config
+
+    def _client(self, concurrency):
+        Context.config = {"list_users_concurrency": concurrency}
+        client = Iterable("mock_api_key")
+        client.get = MagicMock(return_value={"lists": [{"id": 1}, {"id": 2}, {"id": 3}]})
+        responses = {
+            1: MockListUsersResponse(b"a@example.com\nb@example.com\n"),
+            2: MockListUsersResponse(b""),
+            3: MockListUsersResponse(b"c@example.com\n\n  \nd@example.com"),
+        }
+        client._get = MagicMock(side_effect=lambda path, listId: responses[listId])
+        return client, responses
+
+    def test_list_users_streamed(self):
+        client, responses = self._client(1)
+        records = list(client.list_users())
+
+        self.assertEqual([(r["listId"], r["email"]) for r in records],
+                         [(1, "a@example.com"), (1, "b@example.com"), (3, "c@example.com"), (3, "d@example.com")])
+        self.assertTrue(all(response.closed for response in responses.values()))
+
+    def test_list_users_concurrent(self):
+        client, _ = self._client(3)
+        records = list(client.list_users())
+
+        self.assertEqual(sorted((r["listId"], r["email"]) for r in records),
+                         [(1, "a@example.com"), (1, "b@example.com"), (3, "c@example.com"), (3, "d@example.com")])
+
+
+class TestMetadata(unittest.TestCase):
+
+    def setUp(self):
+        self.config = Context.config
+
+    def tearDown(self):
+        Context.config = self.config
+
+    def _client(self, concurrency, fail_once=()):
+        Context.config = {"metadata_concurrency": concurrency}
+        client = Iterable("mock_api_key")
+        failed = set()
+
+        def get(path):
+            parts = path.split("/")
+            if len(parts) == 1:
+                return {"results": [{"name": "t1"}, {"name": "t2"}]}
+            if len(parts) == 2:
+                return {"results": [{"table": parts[1], "key": "k{}".format(i)} for i in range(5)]}
+            if path in fail_once and path not in failed:
+                failed.add(path)
+                raise requests.exceptions.ConnectionError("reset")
+            # Later keys answer faster.
+            time.sleep(0.002 * (5 - int(parts[2][1:])))
+            return {"table": parts[1], "key": parts[2]}
+
+        client.get = MagicMock(side_effect=get)
+        return client
+
+    def test_metadata_order_is_deterministic(self):
+        expected = [{"table": t, "key": "k{}".format(i)} for t in ["t1", "t2"] for i in range(5)]
+        self.assertEqual(list(self._client(1).metadata()), expected)
+        self.assertEqual(list(self._client(4).metadata()), expected)
+
+    @patch("time.sleep")
+    def test_failed_key_retried_on_its_own(self, mock_sleep):
+        telemetry.reset()
+        self.addCleanup(telemetry.reset)
+        client = self._client(4, fail_once=("metadata/t1/k2",))
+        values = list(client.metadata())
+
+        self.assertEqual(len(values), 10)
+        key_calls = [c for c in client.get.call_args_list if c[0][0] == "metadata/t1/k2"]
+        self.assertEqual(len(key_calls), 2)
+        # The table and its other keys were not requested again.
+        self.assertEqual(len([c for c in client.get.call_args_list if c[0][0] == "metadata/t1"]), 1)
+        # The retry is counted under the endpoint `telemetry.endpoint_name` gives the key.
+        self.assertEqual(telemetry._ENDPOINTS[telemetry.endpoint_name("metadata/t1/k2")].retries, 1)
+
+
+class TestTemplates(unittest.TestCase):
+
+    def setUp(self):
+        self.config = Context.config
+        Context.config = {"templates_concurrency": 8}
+
+    def tearDown(self):
+        Context.config = self.config
+
+    def test_templates_deduplicated_across_combinations(self):
+        client = Iterable("mock_api_key")
+
+        def get(path, templateType, messageMedium):
+            # Every Email combination returns template 1; each type has its own template too.
+            templates = [{"templateId": templateType, "updatedAt": 1677051075145}]
+            if messageMedium == "Email":
+                templates.append({"templateId": 1, "updatedAt": 1677051075145})
+            templates.append({"templateId": 0, "updatedAt": 1577051075145})
+            return {"templates": templates}
+
+        client.get = MagicMock(side_effect=get)
+        templates = list(client.templates("updatedAt", "2023-02-22T07:31:15.000000Z"))
+
+        self.assertEqual(client.get.call_count, 16)
+        self.assertEqual([t["templateId"] for t in templates], ["Base", 1, "Blast", "Triggered", "Workflow"])
@@ -0,0 +1,157 @@
+import io
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+from singer.catalog import Catalog
+from singer import metadata
+
+from tap_iterable.context import Context
+from tap_iterable.streams import STREAMS
+from tap_iterable.sync import sync, sync_stream
+
+
+def build_catalog(stream_names):
+    streams = []
+    for name in stream_names:
+        stream = STREAMS[name]()
+        schema = stream.load_schema()
+        mdata = metadata.to_map(stream.load_metadata(schema))
+        mdata = metadata.write(mdata, (), "selected", True)
+        streams.append({
+            "stream": name,
+            "tap_stream_id": name,
+            "schema": schema,
+            "metadata": metadata.to_list(mdata),
+        })
+    return Catalog.from_dict({"streams": streams})
+
+
+class MockClient:
+    """ Returns a few slow records per FULL_TABLE stream. """
+
+    def __init__(self):
+        self.threads = set()
+
+    def _records(self, key):
+        self.threads.add(threading.get_ident())
+        for i in range(3):
+            time.sleep(0.01)
+            yield {"id": i, "name": "{}-{}".format(key, i)}
+
+    def channels(self, column_name=None, bookmark=None):
+        return self._records("channels")
+
+    def message_types(self, column_name=None, bookmark=None):
+        return self._records("message_types")
+
+
+class TestSync(unittest.TestCase):
+    """
+    Test sequential and concurrent syncing of selected streams.
+    """
+
+    def setUp(self):
+        self.config = Context.config
+        Context.config = {"start_date": "2023-01-01T00:00:00Z"}
+
+    def tearDown(self):
+        Context.config = self.config
+
+    def _run(self, state):
+        client = MockClient()
+        output = io.StringIO()
+        with mock.patch("sys.stdout", output):
+            sync(client, build_catalog(["channels", "message_types"]), state)
+        messages = [json.loads(line) for line in output.getvalue().splitlines()]
+        return client, messages
+
+    def test_sequential_sync(self):
+        client, messages = self._run({})
+
+        self.assertEqual(len(client.threads), 1)
+        syncing = [m["value"].get("currently_syncing") for m in messages if m["type"] == "STATE"]
+        self.assertEqual(syncing, ["channels", "message_types", None])
+
+    def test_concurrent_sync_keeps_per_stream_order(self):
+        Context.config["stream_concurrency"] = 2
+        client, messages = self._run({})
+
+        self.assertEqual(len(client.threads), 2)
+        for stream_name in ["channels", "message_types"]:
+            stream_messages = [m for m in messages if m.get("stream") == stream_name]
+            self.assertEqual(stream_messages[0]["type"], "SCHEMA")
+            self.assertEqual([m["record"]["id"] for m in stream_messages[1:]], [0, 1, 2])
+
+        syncing = [m["value"].get("currently_syncing") for m in messages if m["type"] == "STATE"]
+        self.assertIn(["channels", "message_types"], syncing)
+        self.assertIsNone(syncing[-1])
+
+    def test_concurrent_sync_resumes_interrupted_streams_first(self):
+        Context.config["stream_concurrency"] = 2
+        _, messages = self._run({"currently_syncing": ["message_types"]})
+
+        schemas = [m["stream"] for m in messages if m["type"] == "SCHEMA"]
+        self.assertEqual(schemas[0], "message_types")
+
+
+class FailingClient(MockClient):
+    """ `channels` fails at once while `message_types` would take minutes. """
+
+    def channels(self, column_name=None, bookmark=None):
+        time.sleep(0.05)
+        raise RuntimeError("channels failed")
+
+    def message_types(self, column_name=None, bookmark=None):
+        for i in range(10000):
+            time.sleep(0.01)
+            yield {"id": i, "name": "message_types-{}".format(i)}
+
+
+class TestConcurrentFailure(unittest.TestCase):
+    """
+    Test that a failing stream stops the streams in flight.
+    """
+
+    def setUp(self):
+        self.config = Context.config
+        Context.config = {"start_date": "2023-01-01T00:00:00Z", "stream_concurrency": 2}
+
+    def tearDown(self):
+        Context.config = self.config
+
+    def test_failure_raised_without_waiting_for_other_streams(self):
+        started = time.time()
+        with mock.patch("sys.stdout", io.StringIO()):
+            with self.assertRaisesRegex(RuntimeError, "channels failed"):
+                sync(FailingClient(), build_catalog(["channels", "message_types"]), {})
+        self.assertLess(time.time() - started, 5)
+
+
+class TestSyncStream(unittest.TestCase):
+    """
+    Test that per-stream preparation happens once, not per record.
+    """
+
+    def test_users_records_prepared_once(self):
+        catalog = build_catalog(["users"])
+        catalog_entry = catalog.streams[0]
+        instance = STREAMS["users"]()
+        instance.stream = catalog_entry
+        records = [{"email": "user{}@example.com".format(i), "Industry": "retail",
+                    "profileUpdatedAt": 1677051075145} for i in range(5)]
+        instance.sync = lambda state: ((catalog_entry, dict(record)) for record in records)
+
+        with mock.patch.object(catalog_entry.schema, "to_dict", wraps=catalog_entry.schema.to_dict) as to_dict, \
+             mock.patch("tap_iterable.writer.write_record") as write_record, \
+             mock.patch("tap_iterable.writer.write_state"):
+            count = sync_stream({}, instance)
+
+        self.assertEqual(count, 5)
+        self.assertEqual(to_dict.call_count, 1)
+        record = write_record.call_args_list[0][0][1]
+        self.assertEqual(record["_industry"], "retail")
+        self.assertNotIn("Industry", record)
+        self.assertEqual(record["profileUpdatedAt"], "2023-02-22T07:31:15.145000Z")
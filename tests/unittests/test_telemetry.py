@@ -0,0 +1,115 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from tap_iterable import telemetry
+from tap_iterable.exceptions import IterableRateLimitError
+from tap_iterable.iterable import Iterable
+
+from test_backoff import get_response
+
+
+class TestHttpTelemetry(unittest.TestCase):
+    """
+    Test per-endpoint HTTP counters, histograms and their exports.
+    """
+
+    def setUp(self):
+        telemetry.reset()
+        self.addCleanup(telemetry.reset)
+
+    def test_endpoint_names(self):
+        self.assertEqual(telemetry.endpoint_name("export/data.json"), "export/data.json")
+        self.assertEqual(telemetry.endpoint_name("lists/getUsers"), "lists/getUsers")
+        self.assertEqual(telemetry.endpoint_name("metadata"), "metadata")
+        self.assertEqual(telemetry.endpoint_name("metadata/users"), "metadata/{table}")
+        self.assertEqual(telemetry.endpoint_name("metadata/users/bob"), "metadata/{table}/{key}")
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = telemetry.Histogram(buckets=(1, 5))
+        for value in [0.5, 1, 3, 60]:
+            histogram.observe(value)
+        self.assertEqual(histogram.cumulative(), [(1, 2), (5, 3), ("+Inf", 4)])
+        self.assertEqual((histogram.count, histogram.sum), (4, 64.5))
+
+    @mock.patch("time.sleep")
+    @mock.patch("requests.Session.get")
+    def test_retries_and_backoff_counted(self, mock_get, mock_sleep):
+        mock_get.side_effect = [get_response(503, raise_error=True), get_response(429, raise_error=True),
+                                get_response(200, {"channels": []}, content=b'{"channels": []}')]
+
+        with mock.patch("singer.metrics.log") as log:
+            Iterable("api-key").get("channels")
+
+        stats = telemetry._ENDPOINTS["channels"]
+        self.assertEqual(stats.responses, {503: 1, 429: 1, 200: 1})
+        self.assertEqual((stats.retries, stats.throttled), (2, 1))
+        self.assertEqual(stats.backoff_seconds, 2 + 4)
+        self.assertEqual(stats.time_to_first_byte.count, 3)
+        self.assertEqual((stats.transfer.count, stats.bytes), (1, 16))
+
+        timers = [call[0][1] for call in log.call_args_list]
+        self.assertEqual([point.metric for point in timers], ["http_request_duration"] * 3)
+        self.assertEqual([(point.tags["endpoint"], point.tags["http_status_code"], point.tags["status"])
+                          for point in timers],
+                         [("channels", 503, "failed"), ("channels", 429, "failed"), ("channels", 200, "succeeded")])
+
+    @mock.patch("time.sleep")
+    @mock.patch("requests.Session.get")
+    def test_exhausted_retries_still_counted(self, mock_get, mock_sleep):
+        mock_get.side_effect = [get_response(429, raise_error=True)] * 7
+
+        with mock.patch("singer.metrics.log"), self.assertRaises(IterableRateLimitError):
+            Iterable("api-key")._get("export/data.json")
+
+        stats = telemetry._ENDPOINTS["export/data.json"]
+        self.assertEqual((stats.responses, stats.retries, stats.throttled), ({429: 7}, 6, 7))
+
+    def test_emit_metrics_only_for_retried_or_throttled_endpoints(self):
+        telemetry.record_response("channels", 200, 0.1)
+        telemetry.record_response("export/data.json", 429, 0.1)
+        telemetry.record_backoff("export/data.json", 30)
+
+        with mock.patch("singer.metrics.log") as log:
+            telemetry.emit_metrics()
+
+        points = [(point.metric, point.value, point.tags["endpoint"]) for point in
+                  (call[0][1] for call in log.call_args_list)]
+        self.assertEqual(points, [("http_retries", 1, "export/data.json"),
+                                  ("http_backoff", 30, "export/data.json"),
+                                  ("http_throttled", 1, "export/data.json")])
+
+    def test_prometheus_textfile(self):
+        telemetry.record_response("export/data.json", 200, 0.3)
+        telemetry.record_response("export/data.json", 429, 0.05)
+        telemetry.record_transfer("export/data.json", 12.5, 1000)
+        telemetry.record_backoff("export/data.json", 4)
+        telemetry.record_rate_limit_wait("export/data.json", 15.0)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "tap_iterable.prom")
+            telemetry.write_prometheus_textfile(path)
+            self.assertEqual(os.listdir(tmp), ["tap_iterable.prom"])
+            with open(path) as f:
+                lines = f.read().splitlines()
+
+        labels = 'endpoint="export/data.json"'
+        for line in [
+                '# TYPE tap_iterable_http_requests_total counter',
+                'tap_iterable_http_requests_total{%s,code="200"} 1' % labels,
+                'tap_iterable_http_requests_total{%s,code="429"} 1' % labels,
+                '# TYPE tap_iterable_http_time_to_first_byte_seconds histogram',
+                'tap_iterable_http_time_to_first_byte_seconds_bucket{%s,le="0.05"} 1' % labels,
+                'tap_iterable_http_time_to_first_byte_seconds_bucket{%s,le="0.5"} 2' % labels,
+                'tap_iterable_http_time_to_first_byte_seconds_bucket{%s,le="+Inf"} 2' % labels,
+                'tap_iterable_http_time_to_first_byte_seconds_count{%s} 2' % labels,
+                'tap_iterable_http_transfer_seconds_bucket{%s,le="10"} 0' % labels,
+                'tap_iterable_http_transfer_seconds_bucket{%s,le="30"} 1' % labels,
+                'tap_iterable_http_transfer_seconds_sum{%s} 12.5' % labels,
+                'tap_iterable_http_response_bytes_total{%s} 1000' % labels,
+                'tap_iterable_http_retries_total{%s} 1' % labels,
+                'tap_iterable_http_throttled_total{%s} 1' % labels,
+                'tap_iterable_http_backoff_seconds_total{%s} 4.0' % labels,
+                'tap_iterable_http_rate_limit_wait_seconds_total{%s} 15.0' % labels]:
+            self.assertIn(line, lines)
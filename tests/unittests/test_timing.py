@@ -0,0 +1,80 @@
+import io
+import unittest
+from unittest import mock
+
+from tap_iterable import timing
+from tap_iterable.concurrency import ordered_map
+from tap_iterable.context import Context
+from tap_iterable.sync import sync
+
+from test_sync import MockClient, build_catalog
+
+
+class TestStageTiming(unittest.TestCase):
+    """
+    Test per-stream stage timers, their propagation to worker threads and
+    the metrics and summary they produce.
+    """
+
+    def setUp(self):
+        timing.reset()
+        self.addCleanup(timing.reset)
+
+    def test_add_outside_a_stream_is_ignored(self):
+        timing.add("parse", 1.0)
+        self.assertEqual(timing.summary(), "")
+
+    def test_stages_accumulate_per_stream(self):
+        with mock.patch("tap_iterable.timing.metrics.log"):
+            with timing.track("users") as users:
+                timing.add("download", 0.5, 1000)
+                timing.add("download", 0.25, 500)
+                timing.add("parse", 0.1)
+            with timing.track("lists") as lists:
+                timing.add("parse", 2.0)
+
+        self.assertEqual(users.seconds["download"], 0.75)
+        self.assertEqual(users.bytes["download"], 1500)
+        self.assertEqual(users.seconds["parse"], 0.1)
+        self.assertEqual(lists.seconds["parse"], 2.0)
+        self.assertEqual(lists.seconds["download"], 0.0)
+
+    def test_worker_threads_add_to_the_submitting_stream(self):
+        def work(item):
+            timing.add("download", 1.0, item)
+            return item
+
+        with mock.patch("tap_iterable.timing.metrics.log"):
+            with timing.track("email_send") as timer:
+                self.assertEqual(list(ordered_map(work, [1, 2, 3, 4], max_workers=2)), [1, 2, 3, 4])
+
+        self.assertEqual(timer.seconds["download"], 4.0)
+        self.assertEqual(timer.bytes["download"], 10)
+
+    def test_metrics_emitted_when_stream_finishes(self):
+        with mock.patch("tap_iterable.timing.metrics.log") as log:
+            with timing.track("users"):
+                timing.add("download", 0.5, 1000)
+            points = [call[0][1] for call in log.call_args_list]
+
+        durations = {point.tags["stage"]: point.value for point in points if point.metric == "stage_duration"}
+        self.assertEqual(set(durations), set(timing.STAGES))
+        self.assertEqual(durations["download"], 0.5)
+        self.assertTrue(all(point.tags["endpoint"] == "users" for point in points))
+        byte_counts = [point for point in points if point.metric == "stage_bytes"]
+        self.assertEqual([(point.tags["stage"], point.value) for point in byte_counts], [("download", 1000)])
+
+    def test_sync_reports_records_and_stages(self):
+        config = Context.config
+        Context.config = {"start_date": "2023-01-01T00:00:00Z"}
+        self.addCleanup(setattr, Context, "config", config)
+
+        with mock.patch("sys.stdout", io.StringIO()), \
+             mock.patch("tap_iterable.sync.LOGGER.info") as info:
+            sync(MockClient(), build_catalog(["channels", "message_types"]), {})
+
+        summary = [call[0][1] for call in info.call_args_list if call[0][0].startswith("Seconds per stage")]
+        self.assertEqual(len(summary), 1)
+        lines = summary[0].splitlines()
+        self.assertEqual(lines[0].split()[:2], ["stream", "records"])
+        self.assertEqual([line.split()[:2] for line in lines[1:]], [["channels", "3"], ["message_types", "3"]])
@@ -0,0 +1,221 @@
+import copy
+import json
+import random
+import unittest
+
+from singer import metadata
+from singer import Transformer
+from singer.transform import SchemaMismatch
+
+from tap_iterable.streams import STREAMS
+from tap_iterable.sync import BatchProcessor
+from tap_iterable.transform import compile_record_transform, compile_passthrough_check, Fallback
+import tap_iterable.writer as writer
+
+
+NOISE = [None, "", "abc", "1,234", "12.5", "false", "True", 0, 1, -7, 1.5, True, False,
+         {}, {"x": 1}, [], [1, "a"], "2019-04-03 17:22:32 +00:00", 1554312152000, "not a date"]
+DATETIMES = ["2019-04-03 17:22:32 +00:00", "2023-01-01T00:00:00Z", "2021-06-30 23:59:59.123456 +02:00",
+             1554312152000, 1554312152123.5, "1554312152000", "", None]
+
+
+def random_value(rng, schema, noise):
+    if rng.random() < noise:
+        return copy.deepcopy(rng.choice(NOISE))
+    if "anyOf" in schema:
+        return random_value(rng, rng.choice(schema["anyOf"]), noise)
+    types = schema.get("type", "string")
+    typ = rng.choice(types) if isinstance(types, list) else types
+    if typ == "null":
+        return rng.choice([None, ""])
+    if typ == "string" and schema.get("format") == "date-time":
+        return rng.choice(DATETIMES)
+    if typ == "object":
+        properties = schema.get("properties", {})
+        keys = [key for key in properties if rng.random() < 0.6]
+        value = {key: random_value(rng, properties[key], noise) for key in keys}
+        if rng.random() < 0.2:
+            value["unknownField"] = rng.choice(NOISE)
+        return value
+    if typ == "array":
+        return [random_value(rng, schema["items"], noise) for _ in range(rng.randint(0, 3))]
+    if typ == "integer":
+        return rng.choice([0, 42, -3, "1,000", "17"])
+    if typ == "number":
+        return rng.choice([0, 1.25, -3, "2,500.5", "7"])
+    if typ == "boolean":
+        return rng.choice([True, False, "false", "FALSE", "yes", 0, 1])
+    return rng.choice(["text", "", "ünïcode", 12, 3.5])
+
+
+def run(transform, record):
+    try:
+        return "ok", repr(transform(record))
+    except SchemaMismatch as exc:
+        return "error", str(exc)
+
+
+class TestCompiledTransform(unittest.TestCase):
+    """
+    Differential test: the compiled transform (falling back to `Transformer`)
+    must produce exactly what `Transformer` alone produces.
+    """
+
+    def check_stream(self, stream_name, deselect_ratio, noise, seed):
+        rng = random.Random(seed)
+        stream = STREAMS[stream_name]()
+        schema = stream.load_schema()
+        mdata = metadata.to_map(stream.load_metadata(schema))
+        for breadcrumb in list(mdata):
+            if breadcrumb and rng.random() < deselect_ratio:
+                mdata = metadata.write(mdata, breadcrumb, "selected", False)
+
+        generic = Transformer(integer_datetime_fmt="unix-milliseconds-integer-datetime-parsing")
+        fallback = Transformer(integer_datetime_fmt="unix-milliseconds-integer-datetime-parsing")
+        compiled = compile_record_transform(copy.deepcopy(schema), mdata, fallback)
+        self.assertIsNotNone(compiled)
+
+        def compiled_or_fallback(record):
+            try:
+                return compiled(record)
+            except Fallback:
+                return fallback.transform(record, schema, mdata)
+
+        for _ in range(150):
+            record = random_value(rng, schema, noise)
+            if not isinstance(record, dict):
+                record = {}
+            expected = run(lambda r: generic.transform(r, schema, mdata), copy.deepcopy(record))
+            actual = run(compiled_or_fallback, copy.deepcopy(record))
+            self.assertEqual(expected, actual, record)
+        self.assertEqual(generic.removed, fallback.removed)
+        self.assertEqual(generic.filtered, fallback.filtered)
+
+    def test_matches_transformer_for_every_stream(self):
+        for seed, stream_name in enumerate(sorted(STREAMS)):
+            with self.subTest(stream=stream_name):
+                self.check_stream(stream_name, deselect_ratio=0.0, noise=0.0, seed=seed)
+                self.check_stream(stream_name, deselect_ratio=0.2, noise=0.05, seed=seed)
+
+    def test_matches_transformer_on_bad_data(self):
+        for stream_name in ["users", "email_send", "campaigns"]:
+            with self.subTest(stream=stream_name):
+                self.check_stream(stream_name, deselect_ratio=0.1, noise=0.3, seed=7)
+
+    def test_record_not_modified(self):
+        schema = {"type": "object", "properties": {"a": {"type": "integer"}, "b": {"type": "string"}}}
+        mdata = {("properties", "b"): {"selected": False}}
+        transformer = Transformer()
+        record = {"a": "1,000", "b": "x", "c": 1}
+        result = compile_record_transform(schema, mdata, transformer)(record)
+        self.assertEqual(result, {"a": 1000})
+        self.assertEqual(record, {"a": "1,000", "b": "x", "c": 1})
+        self.assertEqual(transformer.removed, {"c"})
+        self.assertEqual(transformer.filtered, {"b"})
+
+    def test_mismatch_falls_back(self):
+        schema = {"type": "object", "properties": {"a": {"type": ["null", "integer"]}}}
+        compiled = compile_record_transform(schema, {}, Transformer())
+        with self.assertRaises(Fallback):
+            compiled({"a": "not a number"})
+
+    def test_unsupported_schemas_not_compiled(self):
+        transformer = Transformer()
+        self.assertIsNone(compile_record_transform(
+            {"type": "object", "patternProperties": {".*": {"type": "string"}}}, {}, transformer))
+        self.assertIsNone(compile_record_transform(
+            {"type": "object", "properties": {"a": {"type": "object"}}},
+            {("properties", "a", "properties", "b"): {"selected": False}}, transformer))
+
+
+class TestRawPassthrough(unittest.TestCase):
+    """
+    Differential test: a record written from its original JSON must be
+    exactly what transforming and encoding it would have written.
+    """
+
+    def test_matches_transformer_for_every_stream(self):
+        passed_through = 0
+        for seed, stream_name in enumerate(sorted(STREAMS)):
+            rng = random.Random(seed)
+            stream = STREAMS[stream_name]()
+            schema = stream.load_schema()
+            mdata = metadata.to_map(stream.load_metadata(schema))
+            processor = BatchProcessor((stream_name, schema, mdata, stream.record_hooks, True), None,
+                                       stream.replication_key, True, raw_passthrough=True,
+                                       renamed_fields=stream.source_field_names.values())
+            generic = Transformer(integer_datetime_fmt="unix-milliseconds-integer-datetime-parsing")
+            for _ in range(300):
+                record = random_value(rng, schema, 0.02)
+                if not isinstance(record, dict):
+                    record = {}
+                line = json.dumps(record, ensure_ascii=rng.random() < 0.5).encode("utf-8")
+                encoded = processor.encode_raw(line, copy.deepcopy(record))
+                if encoded is None:
+                    continue
+                passed_through += 1
+                transformed = generic.transform(copy.deepcopy(record), schema, mdata)
+                # Same message, down to the type of every value.
+                self.assertEqual(repr(json.loads(encoded)),
+                                 repr(json.loads(writer.encode_record(stream_name, transformed))), record)
+        self.assertGreater(passed_through, 100)
+
+    def test_users_unions_and_renamed_fields(self):
+        stream = STREAMS["users"]()
+        schema = stream.load_schema()
+        mdata = metadata.to_map(stream.load_metadata(schema))
+        processor = BatchProcessor(("users", schema, mdata, stream.record_hooks, True), None,
+                                   stream.replication_key, True, raw_passthrough=True,
+                                   renamed_fields=stream.source_field_names.values())
+        record = {"email": "a@example.com", "profileUpdatedAt": "2023-01-02 03:04:05 +00:00",
+                  "offers": [{"url": "x"}, None], "devices": {"os": "ios"}, "wishList": None}
+        line = json.dumps(record).encode()
+        transformed = Transformer(integer_datetime_fmt="unix-milliseconds-integer-datetime-parsing").transform(
+            copy.deepcopy(record), schema, mdata)
+        self.assertEqual(json.loads(processor.encode_raw(line, copy.deepcopy(record))),
+                         json.loads(writer.encode_record("users", transformed)))
+        for changed in [{"Industry": "retail"}, {"offers": "x"}, {"devices": ""}]:
+            line = json.dumps(dict(record, **changed)).encode()
+            self.assertIsNone(processor.encode_raw(line, json.loads(line)), changed)
+
+    def test_export_datetimes_rewritten(self):
+        schema = {"type": "object", "properties": {
+            "createdAt": {"type": ["null", "string"], "format": "date-time"},
+            "name": {"type": ["null", "string"]},
+            "count": {"type": ["null", "integer"]}}}
+        check = compile_passthrough_check(schema, {}, Transformer())
+        self.assertEqual(check({"createdAt": "2023-01-02 03:04:05 +00:00", "name": None}),
+                         [("2023-01-02 03:04:05 +00:00", "2023-01-02T03:04:05.000000Z")])
+        self.assertEqual(check({"createdAt": "2023-01-02T03:04:05.000000Z", "count": 3}), [])
+        for record in [{"createdAt": "2023-01-02 03:04:05 +02:00"}, {"createdAt": "2023-02-30 03:04:05 +00:00"},
+                       {"createdAt": ""}, {"count": "3"}, {"count": ""}, {"count": True}, {"other": 1}]:
+            self.assertIsNone(check(record), record)
+
+    def test_non_finite_numbers_take_full_path(self):
+        schema = {"type": "object", "properties": {
+            "createdAt": {"type": ["null", "string"], "format": "date-time"},
+            "x": {"type": ["null", "number"]}}}
+        processor = BatchProcessor(("s", schema, {}, (), True), None, "createdAt", True, raw_passthrough=True)
+        self.assertIsNotNone(processor.encode_raw(b'{"createdAt":"2023-01-02 03:04:05 +00:00","x":1.5}',
+                                                  {"createdAt": "2023-01-02 03:04:05 +00:00", "x": 1.5}))
+        for literal in ["NaN", "Infinity", "-Infinity"]:
+            line = '{{"createdAt":"2023-01-02 03:04:05 +00:00","x":{}}}'.format(literal).encode()
+            self.assertIsNone(processor.encode_raw(line, json.loads(line)), literal)
+
+    def test_date_time_elsewhere_in_line_not_rewritten(self):
+        schema = {"type": "object", "properties": {
+            "createdAt": {"type": ["null", "string"], "format": "date-time"},
+            "name": {"type": ["null", "string"]}}}
+        processor = BatchProcessor(("s", schema, {}, (), True), None, "createdAt", True, raw_passthrough=True)
+        value = "2023-01-02 03:04:05 +00:00"
+        line = json.dumps({"createdAt": value, "name": value}).encode()
+        self.assertIsNone(processor.encode_raw(line, json.loads(line)))
+        line = json.dumps({"createdAt": value, "name": "x"}).encode()
+        self.assertEqual(json.loads(processor.encode_raw(line, json.loads(line))),
+                         {"type": "RECORD", "stream": "s",
+                          "record": {"createdAt": "2023-01-02T03:04:05.000000Z", "name": "x"}})
+
+    def test_not_compiled_when_fields_are_dropped(self):
+        schema = {"type": "object", "properties": {"a": {"type": "integer"}, "b": {"type": "string"}}}
+        self.assertIsNone(compile_passthrough_check(schema, {("properties", "b"): {"selected": False}},
+                                                    Transformer()))
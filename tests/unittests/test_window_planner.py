@@ -0,0 +1,80 @@
+import unittest
+from unittest.mock import patch
+
+from tap_iterable.iterable import Iterable
+from tap_iterable.window_planner import WindowPlanner
+
+
+class TestWindowPlanner(unittest.TestCase):
+    """
+    Test adaptive sizing of data export windows.
+    """
+
+    def _planner(self, window_in_days=10):
+        return WindowPlanner(window_in_days, min_window_in_days=1, max_window_in_days=40,
+                             target_records=1000, target_bytes=10 ** 6)
+
+    def test_empty_window_grows(self):
+        planner = self._planner()
+        planner.plan(100)
+        self.assertEqual(planner.observe(0, 0), 20)
+
+    def test_busy_window_shrinks_to_target(self):
+        planner = self._planner()
+        planner.plan(100)
+        # 2000 records in 10 days, target 1000 -> 5 days
+        self.assertEqual(planner.observe(2000, 100), 5)
+
+    def test_bytes_can_drive_the_size(self):
+        planner = self._planner()
+        planner.plan(100)
+        self.assertEqual(planner.observe(10, 2 * 10 ** 6), 5)
+
+    def test_step_and_bounds_are_clamped(self):
+        planner = self._planner()
+        planner.plan(100)
+        # Would be 0.01 days, but one step shrinks at most to a quarter.
+        self.assertEqual(planner.observe(10 ** 6, 0), 2.5)
+        planner.plan(100)
+        self.assertEqual(planner.observe(10 ** 6, 0), 1)
+        planner = self._planner(window_in_days=30)
+        planner.plan(100)
+        self.assertEqual(planner.observe(0, 0), 40)
+
+    def test_short_final_window_uses_density(self):
+        planner = self._planner()
+        planner.plan(2)
+        # 100 records in 2 days -> 20 days would hit the target.
+        self.assertEqual(planner.observe(100, 0), 20)
+
+    def test_observations_matched_in_planning_order(self):
+        planner = self._planner()
+        self.assertEqual(planner.plan(100), 10)
+        self.assertEqual(planner.plan(100), 10)
+        planner.observe(500, 0)
+        self.assertEqual(planner.window_in_days, 20)
+        self.assertEqual(planner.plan(100), 20)
+        planner.observe(2000, 0)
+        self.assertEqual(planner.window_in_days, 5)
+
+    def test_invalid_bounds(self):
+        with self.assertRaises(ValueError):
+            WindowPlanner(10, min_window_in_days=5, max_window_in_days=1)
+
+
+class TestPlannedDaterange(unittest.TestCase):
+    """
+    Test the export windows scheduled by the client with a planner.
+    """
+
+    @patch.object(Iterable, "_now", return_value="2023-01-25 00:00:00")
+    def test_contiguous_windows_until_now(self, mock_now):
+        client = Iterable("api-key")
+        planner = WindowPlanner(10, min_window_in_days=1, max_window_in_days=40)
+        windows = list(client.get_start_end_date("2023-01-01T00:00:00Z", planner))
+
+        self.assertEqual(windows, [
+            {"startDateTime": "2023-01-01 00:00:00", "endDateTime": "2023-01-11 00:00:00"},
+            {"startDateTime": "2023-01-11 00:00:00", "endDateTime": "2023-01-21 00:00:00"},
+            {"startDateTime": "2023-01-21 00:00:00", "endDateTime": "2023-01-25 00:00:00"},
+        ])
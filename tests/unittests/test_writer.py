@@ -0,0 +1,80 @@
+import io
+import json
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+import tap_iterable.writer as writer
+
+
+class BinaryStdout(io.TextIOWrapper):
+    """ Text stdout with an underlying binary buffer, like `sys.stdout`. """
+
+    def __init__(self):
+        super().__init__(io.BytesIO(), encoding="utf-8")
+
+    def output(self):
+        self.flush()
+        return self.buffer.getvalue().decode("utf-8")
+
+
+class TestWriter(unittest.TestCase):
+    """
+    Test the buffered Singer message writer.
+    """
+
+    def setUp(self):
+        self.stdout = BinaryStdout()
+        patcher = mock.patch("sys.stdout", self.stdout)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(writer.configure)
+
+    def messages(self):
+        return [json.loads(line) for line in self.stdout.output().splitlines()]
+
+    def test_records_buffered_until_state(self):
+        writer.configure(buffer_size_kb=64)
+        writer.write_schema("channels", {"type": "object"}, ["id"])
+        writer.write_record("channels", {"id": 1})
+        writer.write_record("channels", {"id": 2})
+        self.assertEqual(len(self.messages()), 1)
+
+        writer.write_state({"bookmarks": {}})
+        self.assertEqual([m["type"] for m in self.messages()], ["SCHEMA", "RECORD", "RECORD", "STATE"])
+        self.assertEqual(self.messages()[2], {"type": "RECORD", "stream": "channels", "record": {"id": 2}})
+
+    def test_buffer_flushed_when_full(self):
+        writer.configure(buffer_size_kb=0.05)
+        for i in range(3):
+            writer.write_record("channels", {"id": i, "name": "x" * 20})
+        self.assertGreaterEqual(len(self.messages()), 2)
+        writer.flush()
+        self.assertEqual([m["record"]["id"] for m in self.messages()], [0, 1, 2])
+
+    def test_stdlib_encoder_matches_singer(self):
+        writer.configure(buffer_size_kb=0, fast_json=False)
+        writer.write_record("users", {"email": "é@example.com", "score": 1.5})
+        self.assertEqual(self.stdout.output(),
+                         '{"type": "RECORD", "stream": "users", '
+                         '"record": {"email": "\\u00e9@example.com", "score": 1.5}}\n')
+
+    def test_unsupported_types_fall_back(self):
+        writer.configure(buffer_size_kb=0)
+        writer.write_record("users", {"amount": Decimal("1.10")})
+        self.assertIn('"amount": 1.10', self.stdout.output())
+
+    def test_non_finite_floats_raise_as_in_singer(self):
+        for fast_json in (True, False):
+            for record in ({"score": float("nan")}, {"nested": [{"score": float("inf")}], "other": None}):
+                with self.assertRaises(ValueError):
+                    writer.encode_record("users", record, fast_json)
+        self.assertEqual(json.loads(writer.encode_record("users", {"score": None})),
+                         {"type": "RECORD", "stream": "users", "record": {"score": None}})
+
+    def test_text_only_stdout(self):
+        stdout = io.StringIO()
+        with mock.patch("sys.stdout", stdout):
+            writer.configure(buffer_size_kb=0)
+            writer.write_record("channels", {"id": 1})
+        self.assertEqual(json.loads(stdout.getvalue())["record"], {"id": 1})